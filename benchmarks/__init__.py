@@ -0,0 +1,9 @@
+# -*- coding: utf8 -*-
+"""Benchmarks of lazyscraper parsing and extraction. Run with::
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --compare results.json
+
+Pages are generated, see :mod:`benchmarks.fixtures`, paginated benchmarks use local HTTP server
+from :mod:`benchmarks.server`, so results do not depend on network.
+"""
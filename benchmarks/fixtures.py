@@ -0,0 +1,48 @@
+# -*- coding: utf8 -*-
+"""Generated HTML pages used by benchmarks. Each page has table, UL list, SELECT options, external
+links and a form, so every pattern has data to extract"""
+import os
+
+NODES_PER_UNIT = 9
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+
+def make_page(nodes, page=1, nextlink=False):
+    """Returns HTML page with about nodes elements. Page number is put into values, if nextlink is
+    True page has rel=next link to the following page"""
+    units = max(nodes // NODES_PER_UNIT, 1)
+    rows = ''.join('<tr><td>%d</td><td>name %d-%d</td><td><a href="/item/%d">item</a></td></tr>\n'
+                   % (i, page, i, i) for i in range(units))
+    items = ''.join('<li><a href="/section/%d">Section %d</a></li>\n' % (i, i)
+                    for i in range(units))
+    options = ''.join('<option value="%d">Option %d</option>' % (i, i) for i in range(units))
+    links = ''.join('<a href="http://site%d.example.com/">Site %d</a>\n' % (i, i)
+                    for i in range(units))
+    nxt = '<a rel="next" href="?page=%d">next</a>' % (page + 1) if nextlink else ''
+    return ('<html><head><title>Page %d</title></head><body>'
+            '<table id="data"><thead><tr><th>id</th><th>name</th><th>link</th></tr></thead>'
+            '<tbody>%s</tbody></table>'
+            '<ul class="menu">%s</ul><select id="sel">%s</select><div class="links">%s</div>'
+            '<form name="search" action="/search" method="get"><input name="q" type="text"/>'
+            '<select name="sort"><option value="date">Date</option>'
+            '<option value="name">Name</option></select>'
+            '<button name="go" value="1">Go</button></form>%s</body></html>') % (
+            page, rows, items, options, links, nxt)
+
+
+def fixture_path(path, nodes):
+    return os.path.join(path, 'page_%d.html' % (nodes))
+
+
+def write_fixtures(path, sizes=DEFAULT_SIZES):
+    """Writes pages of each size to path, existing fixtures are kept. Returns dict of size and
+    filename"""
+    os.makedirs(path, exist_ok=True)
+    files = {}
+    for nodes in sizes:
+        filename = fixture_path(path, nodes)
+        if not os.path.exists(filename):
+            with open(filename, 'w', encoding='utf8') as f:
+                f.write(make_page(nodes))
+        files[nodes] = filename
+    return files
@@ -0,0 +1,229 @@
+# -*- coding: utf8 -*-
+"""Runs benchmarks and saves results as JSON. Each benchmark runs in its own process, so peak RSS is
+measured per benchmark. Python allocations are measured in separate run with tracemalloc, as tracing
+slows code down; memory allocated by lxml itself is not traced, it is seen in peak RSS"""
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import tempfile
+import tracemalloc
+import multiprocessing
+
+import click
+
+import lazyscraper
+from lazyscraper.urltools import get_from_file
+from lazyscraper.htmltools import taglist_to_dict, table_to_dict, compiled_xpath
+from lazyscraper.patterns import PATTERNS
+from lazyscraper.scraper import extract_data_xpath, get_table
+
+from .fixtures import write_fixtures, DEFAULT_SIZES
+from .server import PagesServer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def bench_get_from_file(filename):
+    seconds, root = _timed(lambda: get_from_file(filename))
+    return seconds, 1, 0
+
+
+def bench_taglist_to_dict(filename):
+    tags = compiled_xpath('//a')(get_from_file(filename).getroottree())
+    seconds, rows = _timed(lambda: taglist_to_dict(tags, ['href', '_text']))
+    return seconds, 1, len(rows)
+
+
+def bench_table_to_dict(filename):
+    node = compiled_xpath('//table')(get_from_file(filename).getroottree())[0]
+    seconds, rows = _timed(lambda: table_to_dict(node))
+    return seconds, 1, len(rows)
+
+
+def bench_pattern(filename, pattern):
+    tree = get_from_file(filename).getroottree()
+    pat = PATTERNS[pattern]
+    seconds, data = _timed(lambda: pat['func'](tree, None, None, pat['deffields']))
+    return seconds, 1, data['total'] if isinstance(data, dict) else len(data)
+
+
+def _paginated(func, nodes, pages, latency, workers):
+    server = PagesServer(nodes, pages, latency).start()
+    try:
+        seconds, rows = _timed(lambda: func(server.url, '1,%d,1,-1' % (pages), workers))
+    finally:
+        server.stop()
+    return seconds, pages, len(rows)
+
+
+def bench_extract_data_xpath(nodes, pages, latency, workers):
+    xpath = "//table[@id='data']/tbody/tr/td[2]"
+    return _paginated(lambda url, pagerange, workers: extract_data_xpath(url, xpath=xpath,
+                                                                         fieldnames='_text',
+                                                                         pagekey='page',
+                                                                         pagerange=pagerange,
+                                                                         workers=workers),
+                      nodes, pages, latency, workers)
+
+
+def bench_get_table(nodes, pages, latency, workers):
+    return _paginated(lambda url, pagerange, workers: get_table(url, nodeid='data', pagekey='page',
+                                                                pagerange=pagerange,
+                                                                workers=workers),
+                      nodes, pages, latency, workers)
+
+
+BENCHMARKS = {
+    'get_from_file' : bench_get_from_file,
+    'taglist_to_dict' : bench_taglist_to_dict,
+    'table_to_dict' : bench_table_to_dict,
+    'pattern' : bench_pattern,
+    'extract_data_xpath' : bench_extract_data_xpath,
+    'get_table' : bench_get_table,
+}
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def _child(name, params, allocations, queue):
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        if allocations:
+            tracemalloc.start()
+        seconds, pages, rows = BENCHMARKS[name](**params)
+        result = {'seconds' : seconds, 'pages' : pages, 'rows' : rows,
+                  'peak_rss_kb' : _peak_rss_kb()}
+        if allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            result = {'alloc_peak_kb' : peak // 1024, 'alloc_kb' : current // 1024}
+        queue.put(result)
+    except Exception as e:
+        queue.put({'error' : repr(e)})
+
+
+def run_isolated(name, params, allocations=False):
+    """Runs benchmark in new process and returns its results"""
+    method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    ctx = multiprocessing.get_context(method)
+    queue = ctx.Queue()
+    process = ctx.Process(target=_child, args=(name, params, allocations, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    if 'error' in result:
+        raise RuntimeError('Benchmark %s %s failed: %s' % (name, params, result['error']))
+    return result
+
+
+def run_benchmark(name, params, repeat=1, allocations=True):
+    """Runs benchmark repeat times and returns record with the best time, throughput, peak RSS and
+    allocations"""
+    runs = [run_isolated(name, params) for i in range(repeat)]
+    best = min(runs, key=lambda r: r['seconds'])
+    seconds = best['seconds']
+    record = {'name' : name, 'params' : params, 'seconds' : round(seconds, 6),
+              'pages' : best['pages'], 'rows' : best['rows'],
+              'pages_per_sec' : round(best['pages'] / seconds, 2) if seconds else None,
+              'rows_per_sec' : round(best['rows'] / seconds, 2) if seconds else None,
+              'peak_rss_kb' : max(r['peak_rss_kb'] or 0 for r in runs) or None}
+    if allocations:
+        record.update(run_isolated(name, params, allocations=True))
+    return record
+
+
+def plan(sizes, fixtures, pages, latency, workers):
+    """Returns list of (name, params) of all benchmarks"""
+    files = write_fixtures(fixtures, sizes)
+    benchmarks = []
+    for nodes in sizes:
+        filename = files[nodes]
+        benchmarks.append(('get_from_file', {'filename' : filename}))
+        benchmarks.append(('taglist_to_dict', {'filename' : filename}))
+        benchmarks.append(('table_to_dict', {'filename' : filename}))
+        for pattern in sorted(PATTERNS):
+            benchmarks.append(('pattern', {'filename' : filename, 'pattern' : pattern}))
+    for name in ['extract_data_xpath', 'get_table']:
+        for w in workers:
+            benchmarks.append((name, {'nodes' : min(sizes), 'pages' : pages, 'latency' : latency,
+                                      'workers' : w}))
+    return benchmarks
+
+
+def record_key(record):
+    params = dict(record['params'])
+    if 'filename' in params:
+        params['filename'] = os.path.basename(params['filename'])
+    return record['name'], json.dumps(params, sort_keys=True)
+
+
+def print_record(record, old=None):
+    params = ' '.join('%s=%s' % (k, os.path.basename(str(v)))
+                      for k, v in sorted(record['params'].items()))
+    line = '%-20s %-45s %10.4fs %12s rows/s %10s pages/s rss %8s kB' % (
+        record['name'], params, record['seconds'], record['rows_per_sec'], record['pages_per_sec'],
+        record['peak_rss_kb'])
+    if record.get('alloc_peak_kb') is not None:
+        line += ' alloc %8s kB' % (record['alloc_peak_kb'])
+    if old is not None and old['seconds']:
+        line += ' x%.2f' % (old['seconds'] / record['seconds'] if record['seconds'] else 0)
+    click.echo(line)
+
+
+@click.command()
+@click.option('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+              help='Fixture sizes, number of nodes, comma separated')
+@click.option('--pages', default=20, type=int, help='Number of pages in paginated benchmarks')
+@click.option('--latency', default=0.05, type=float, help='Simulated response latency, seconds')
+@click.option('--workers', default='1,4', help='Workers of paginated benchmarks, comma separated')
+@click.option('--repeat', default=3, type=int, help='Runs of each benchmark, best time reported')
+@click.option('--only', default=None, help='Run only benchmarks with name containing this text')
+@click.option('--allocations/--no-allocations', default=True,
+              help='Measure Python allocations with tracemalloc')
+@click.option('--fixtures', default=None,
+              help='Directory for generated fixtures, temporary by default')
+@click.option('--output', default=None, help='JSON file to save results')
+@click.option('--compare', default=None,
+              help='JSON file with previous results, speedup shown as xN')
+def main(sizes, pages, latency, workers, repeat, only, allocations, fixtures, output, compare):
+    """Runs lazyscraper benchmarks"""
+    sizes = [int(size) for size in sizes.split(',')]
+    workers = [int(w) for w in workers.split(',')]
+    old = {}
+    if compare:
+        with open(compare, 'r', encoding='utf8') as f:
+            old = {record_key(record): record for record in json.load(f)['results']}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        records = []
+        for name, params in plan(sizes, fixtures or tmpdir, pages, latency, workers):
+            if only and only not in name and only != params.get('pattern'):
+                continue
+            record = run_benchmark(name, params, repeat, allocations)
+            print_record(record, old.get(record_key(record)))
+            records.append(record)
+    results = {'version' : lazyscraper.__version__, 'python' : platform.python_version(),
+               'platform' : platform.platform(), 'cpus' : os.cpu_count(),
+               'time' : time.strftime('%Y-%m-%dT%H:%M:%S'), 'results' : records}
+    if output:
+        with open(output, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
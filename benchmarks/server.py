@@ -0,0 +1,63 @@
+# -*- coding: utf8 -*-
+"""Local threaded HTTP server serving paginated generated pages with simulated latency"""
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from .fixtures import make_page
+
+
+class PagesHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlsplit(self.path).query)
+        page = int(query.get('page', ['1'])[0])
+        if server.latency:
+            time.sleep(server.latency)
+        nodes = server.nodes if page <= server.pages else 0
+        body = server.page(page, nodes)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PagesServer(ThreadingHTTPServer):
+    """Serves /list?page=N pages with about nodes elements up to pages pages, later pages are empty.
+    Each page has rel=next link except the last one. Every response is delayed by latency seconds"""
+    daemon_threads = True
+
+    def __init__(self, nodes=1000, pages=10, latency=0.05, port=0):
+        super().__init__(('127.0.0.1', port), PagesHandler)
+        self.nodes = nodes
+        self.pages = pages
+        self.latency = latency
+        self.pages_cache = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def page(self, page, nodes):
+        with self.lock:
+            if page not in self.pages_cache:
+                self.pages_cache[page] = make_page(nodes, page, page < self.pages).encode('utf8')
+            return self.pages_cache[page]
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/list' % (self.server_address[1])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
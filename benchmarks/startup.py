@@ -0,0 +1,93 @@
+# -*- coding: utf8 -*-
+"""Measures command line startup time. Each command runs in new interpreter, time is wall time of
+the whole process. Modules imported by command are taken from -X importtime output, --help should
+not load scraper dependencies and local file runs should not load HTTP stack. Exits with error if
+target is missed"""
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+import tempfile
+
+import click
+
+from .fixtures import write_fixtures
+
+DEFAULT_TARGET_MS = 200
+HEAVY_MODULES = ['lxml.etree', 'requests', 'urllib3', 'pyarrow', 'bmemcached', 'httpx', 'yaml']
+HTTP_MODULES = ['requests', 'urllib3', 'httpx']
+
+
+def _run(args):
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root] + ([env['PYTHONPATH']] if env.get('PYTHONPATH')
+                                                  else []))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        error = result.stderr.decode('utf8', 'replace')[-500:]
+        raise RuntimeError('Command %s failed: %s' % (' '.join(args), error))
+    return seconds, result.stderr.decode('utf8', 'replace')
+
+
+def imported_modules(args):
+    """Returns names of modules imported by python running args"""
+    seconds, output = _run(['-X', 'importtime'] + args)
+    return {line.rsplit('|', 1)[1].strip() for line in output.splitlines()
+            if line.startswith('import time:')}
+
+
+def measure(args, repeat):
+    """Returns best and median wall time of python running args, in milliseconds"""
+    times = [_run(args)[0] * 1000 for i in range(repeat)]
+    return round(min(times), 1), round(statistics.median(times), 1)
+
+
+@click.command()
+@click.option('--repeat', default=10, type=int,
+              help='Runs of each command, best and median reported')
+@click.option('--target', default=DEFAULT_TARGET_MS, type=float,
+              help='Max median time of --help, milliseconds')
+@click.option('--output', default=None, help='JSON file to save results')
+def main(repeat, target, output):
+    """Measures lazyscraper command line startup time"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = write_fixtures(tmpdir, [1000])[1000]
+        commands = {
+            'python' : (['-c', 'pass'], []),
+            'import' : (['-c', 'import lazyscraper'], HEAVY_MODULES),
+            'help' : (['-m', 'lazyscraper', '--help'], HEAVY_MODULES),
+            'localfile' : (['-m', 'lazyscraper', 'gettable', '--localfile', filename,
+                            '--nodeid', 'data'], HTTP_MODULES),
+        }
+        records = []
+        failed = False
+        for name, (args, forbidden) in commands.items():
+            best, median = measure(args, repeat)
+            loaded = sorted(set(forbidden) & imported_modules(args))
+            records.append({'name' : name, 'best_ms' : best, 'median_ms' : median,
+                            'loaded' : loaded})
+            line = '%-10s best %8.1f ms median %8.1f ms' % (name, best, median)
+            if loaded:
+                failed = True
+                line += ' loads %s' % (', '.join(loaded))
+            click.echo(line)
+    help_median = [r['median_ms'] for r in records if r['name'] == 'help'][0]
+    if help_median > target:
+        failed = True
+        click.echo('--help median %.1f ms is over target %.1f ms' % (help_median, target))
+    if output:
+        with open(output, 'w', encoding='utf8') as f:
+            json.dump({'python' : sys.version.split()[0], 'target_ms' : target,
+                       'results' : records}, f, indent=4)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,5 +3,27 @@ __version__ = '0.1.3'
 __author__ = "Ivan Begtin (ivan@begtin.tech)"
 __license__ = "BSD"
 
+# Public functions are imported from their modules on first access, so importing the package (and
+# running command line tool) does not load lxml and requests until they are needed
+_EXPORTS = {
+    'use_pattern' : 'scraper', 'extract_data_xpath' : 'scraper', 'get_table' : 'scraper',
+    'iter_use_pattern' : 'scraper', 'iter_extract_data_xpath' : 'scraper',
+    'iter_get_table' : 'scraper', 'iter_batch' : 'scraper',
+    'extract_columns_xpath' : 'scraper', 'get_tables' : 'scraper', 'iter_get_tables' : 'scraper',
+    'crawl' : 'crawler', 'iter_crawl' : 'crawler',
+}
 
-from .scraper import use_pattern, extract_data_xpath, get_table
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    from importlib import import_module
+    value = getattr(import_module('.' + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,112 @@
+# -*- coding: utf8 -*-
+"""Async versions of :mod:`lazyscraper.scraper` functions, built on :mod:`lazyscraper.aiotools`"""
+import asyncio
+import logging
+
+from .consts import *
+from .aiotools import async_extract_url, session_scope
+from .patterns import PATTERNS
+from .scraper import page_url, extract_xpath_page, extract_pattern_page, extract_table_page, \
+    _page_numbers, _absolutize_func, _parse_pagerange
+
+
+async def _gather_pages(func, pages, concurrency=DEFAULT_ASYNC_CONNECTIONS, pagesize=-1):
+    """Runs coroutine function func for pages, up to concurrency pages at once. Returns results in
+    page order. If pagesize is not -1 stops after first page with less than pagesize items"""
+    results = []
+    pages = iter(pages)
+    while True:
+        batch = [page for _, page in zip(range(concurrency), pages)]
+        if not batch:
+            break
+        for items in await asyncio.gather(*[func(page) for page in batch]):
+            results.append(items)
+            if pagesize != -1 and len(items) < pagesize:
+                logging.info('Breaking loop. %d vs %d' % (len(items), pagesize))
+                return results
+    return results
+
+
+@session_scope
+async def async_extract_data_xpath(url, xpath=None, fieldnames=None, absolutize=False, post=None,
+                                   pagekey=None, pagerange=None,
+                                   concurrency=DEFAULT_ASYNC_CONNECTIONS):
+    """Extract data with xpath, async version of :func:`lazyscraper.scraper.extract_data_xpath`.
+    Up to concurrency pages fetched at once
+
+    :return: Returns array of extracted values
+    :rtype: :class:`array`."""
+    fields = fieldnames.split(',') if fieldnames else DEFAULT_FIELDS
+
+    async def process_page(current):
+        anurl = page_url(url, pagekey, current) if pagekey else url
+        logging.info('Processing url %s' % (anurl))
+        postdata = ({pagekey : str(current)} if pagekey else {}) if post else None
+        return await async_extract_url(anurl, extract_xpath_page, xpath, fields, postdata=postdata)
+
+    if not pagekey:
+        pages = [await process_page(None)]
+    else:
+        start, end, step, pagesize = _parse_pagerange(pagerange)
+        pages = await _gather_pages(process_page, _page_numbers(start, end, step), concurrency,
+                                    pagesize)
+    fix = _absolutize_func(url, fields, absolutize)
+    return [fix(item) if fix else item for items in pages for item in items]
+
+
+@session_scope
+async def async_use_pattern(url, pattern, nodeid=None, nodeclass=None, fieldnames=None,
+                            absolutize=False, pagekey=False, pagerange=False,
+                            concurrency=DEFAULT_ASYNC_CONNECTIONS):
+    """Uses predefined pattern to extract page data, async version of
+    :func:`lazyscraper.scraper.use_pattern`
+
+    :return: Returns array of extracted values
+    :rtype: :class:`array`."""
+    pat = PATTERNS[pattern]
+    fields = fieldnames.split(',') if fieldnames else pat['deffields']
+
+    async def process_page(anurl):
+        logging.info('Processing url %s' % (anurl))
+        return await async_extract_url(anurl, extract_pattern_page, pattern, nodeclass, nodeid,
+                                       fields)
+
+    if not pagekey:
+        findata = await process_page(url)
+        if pat['json_only']:
+            return findata
+        pages = [findata]
+    else:
+        start, end, step = map(int, pagerange.split(','))
+        pages = await _gather_pages(process_page,
+                                    (page_url(url, pagekey, i) for i in range(start, end, step)),
+                                    concurrency)
+    fix = _absolutize_func(url, fields, absolutize)
+    findata = []
+    for items in pages:
+        if isinstance(items, dict):
+            findata.append(items)
+        else:
+            findata.extend(fix(item) if fix else item for item in items)
+    return findata
+
+
+@session_scope
+async def async_get_table(url, nodeid=None, nodeclass=None, pagekey=False, pagerange=False,
+                          agent=None, concurrency=DEFAULT_ASYNC_CONNECTIONS, headers=False):
+    """Extracts table with data from html, async version of :func:`lazyscraper.scraper.get_table`
+
+    :return: Returns array of extracted values
+    :rtype: :class:`array`."""
+    async def process_page(anurl):
+        logging.info('Crawling url %s' % (anurl))
+        return await async_extract_url(anurl, extract_table_page, nodeclass, nodeid, headers,
+                                       agent=agent)
+
+    if not pagekey:
+        pages = [await process_page(url)]
+    else:
+        start, end, step, pagesize = _parse_pagerange(pagerange)
+        pageurls = (page_url(url, pagekey, i) for i in _page_numbers(start, end, step))
+        pages = await _gather_pages(process_page, pageurls, concurrency, pagesize)
+    return [item for items in pages for item in items]
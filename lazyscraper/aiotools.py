@@ -0,0 +1,189 @@
+# -*- coding: utf8 -*-
+"""Asyncio fetch engine, async versions of :mod:`lazyscraper.urltools` functions. Requires httpx"""
+import time
+import asyncio
+import functools
+import logging
+from urllib.parse import urlsplit
+from .consts import *
+from .cache import cache_key, make_entry, refresh_entry, is_fresh, conditional_headers, get_cache
+from .urltools import parse_cached
+from .ratelimit import get_rate_limiter
+from . import metrics
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class AsyncSession:
+    """Shared async HTTP client with bounded number of concurrent requests per host and globally"""
+    def __init__(self, max_connections=DEFAULT_ASYNC_CONNECTIONS, max_per_host=DEFAULT_POOL_SIZE,
+                 retries=DEFAULT_RETRIES, agent=DEFAULT_USER_AGENT):
+        if httpx is None:
+            raise ImportError('httpx required for async fetch engine')
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_connections)
+        transport = httpx.AsyncHTTPTransport(verify=False, retries=retries, limits=limits)
+        self.client = httpx.AsyncClient(transport=transport, headers={'User-Agent' : agent},
+                                        follow_redirects=True)
+        self.max_per_host = max_per_host
+        self.total = asyncio.Semaphore(max_connections)
+        self.hosts = {}
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            limit = self.max_per_host
+            limiter = get_rate_limiter()
+            if limiter is not None and limiter.max_concurrent:
+                limit = min(limit, limiter.max_concurrent)
+            self.hosts[host] = asyncio.Semaphore(limit)
+        return self.hosts[host]
+
+    async def request(self, method, url, data=None, headers=None):
+        """Sends request when both global and per host limits allow it.
+        If rate limiter is set, waits for it and retries requests throttled by host"""
+        limiter = get_rate_limiter()
+        attempt = 0
+        while True:
+            if limiter is not None:
+                delay = limiter.reserve(url)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            # Host slot is taken first, so requests waiting for busy host do not hold global slots
+            # of other hosts
+            async with self._host_semaphore(url), self.total:
+                r = await self._send(method, url, data, headers)
+            if limiter is None or attempt >= limiter.retries or \
+                    not limiter.feedback(url, r.status_code, r.headers.get('Retry-After')):
+                return r
+            logging.info('Throttled by host with status %d, retrying url %s' % (r.status_code, url))
+            attempt += 1
+
+    async def _send(self, method, url, data, headers):
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        metrics.request_started(host)
+        try:
+            r = await self.client.request(method, url, data=data, headers=headers)
+        except Exception as e:
+            metrics.request_finished(host, type(e).__name__, time.perf_counter() - start)
+            raise
+        metrics.request_finished(host, r.status_code, time.perf_counter() - start, len(r.content))
+        return r
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_sessions = {}
+_scopes = {}
+
+
+def configure_async_session(max_connections=DEFAULT_ASYNC_CONNECTIONS,
+                            max_per_host=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                            agent=DEFAULT_USER_AGENT, keep=True):
+    """Creates shared async session for running event loop. Session is kept until
+    :func:`close_async_session`, if keep is False it is closed when the last async scraper function
+    running in the loop returns"""
+    session = AsyncSession(max_connections, max_per_host, retries, agent)
+    session.keep = keep
+    _sessions[asyncio.get_running_loop()] = session
+    return session
+
+
+def get_async_session():
+    """Returns shared async session of running event loop, creates it with default settings if not
+    configured"""
+    session = _sessions.get(asyncio.get_running_loop())
+    if session is None:
+        session = configure_async_session(keep=False)
+    return session
+
+
+async def close_async_session():
+    """Closes shared async session of running event loop"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.aclose()
+
+
+def session_scope(func):
+    """Decorates async scraper function. Session created implicitly while such functions run in the
+    loop is closed when the last of them returns, so asyncio.run() of single call does not leave
+    open client"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        _scopes[loop] = _scopes.get(loop, 0) + 1
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _scopes[loop] -= 1
+            if not _scopes[loop]:
+                del _scopes[loop]
+                session = _sessions.get(loop)
+                if session is not None and not session.keep:
+                    await close_async_session()
+    return wrapper
+
+
+async def _async_fetch(url, postdata=None, timeout=None, cache=None, agent=DEFAULT_USER_AGENT):
+    """Async version of :func:`lazyscraper.urltools._fetch`. Cache is read and written in thread,
+    disk and memcached backends block"""
+    if cache is None:
+        cache = get_cache()
+    method = 'POST' if postdata is not None else 'GET'
+    key = cache_key(url, method, postdata)
+    entry = None
+    headers = {'User-Agent' : agent} if agent else {}
+    if cache is not None:
+        entry = await asyncio.to_thread(cache.get, key, stale=True)
+        if entry is not None:
+            if is_fresh(entry):
+                return entry['content'], key, True
+            headers.update(conditional_headers(entry))
+    r = await get_async_session().request(method, url, data=postdata, headers=headers)
+    if cache is None:
+        return r.content, None, False
+    ttl = timeout if timeout is not None else cache.timeout
+    if r.status_code == 304 and entry is not None:
+        logging.debug('Not modified %s' % (url))
+        await asyncio.to_thread(cache.set, key, refresh_entry(entry, ttl))
+        return entry['content'], key, True
+    if r.status_code == 200:
+        await asyncio.to_thread(cache.set, key, make_entry(r.content, r.headers, ttl))
+    return r.content, key, False
+
+
+async def async_fetch_url(url, postdata=None, timeout=None, cache=None, agent=DEFAULT_USER_AGENT):
+    """Returns raw content of url, async version of :func:`lazyscraper.urltools.fetch_url`"""
+    return (await _async_fetch(url, postdata, timeout, cache, agent))[0]
+
+
+async def _async_get_root(url, postdata, timeout, cache, agent):
+    content = (await _async_fetch(url, postdata, timeout, cache, agent))[0]
+    return await asyncio.to_thread(parse_cached, content)
+
+
+async def async_get_cached_post(url, postdata, agent=DEFAULT_USER_AGENT, timeout=None, cache=None):
+    """Returns url data from url with post request or from cache. Html is parsed in thread, not
+    blocking event loop"""
+    return await _async_get_root(url, postdata, timeout, cache, agent)
+
+
+async def async_get_cached_url(url, timeout=None, agent=DEFAULT_USER_AGENT, cache=None):
+    """Returns url data from url or from cache. Html is parsed in thread, not blocking event loop"""
+    return await _async_get_root(url, None, timeout, cache, agent)
+
+
+def _extract(content, func, args):
+    return func(parse_cached(content), *args)
+
+
+async def async_extract_url(url, func, *args, postdata=None, agent=DEFAULT_USER_AGENT):
+    """Fetches url and returns func(root, *args) for parsed page. Page is parsed and extracted
+    together in thread, not blocking event loop"""
+    content = (await _async_fetch(url, postdata, agent=agent))[0]
+    return await asyncio.to_thread(_extract, content, func, args)
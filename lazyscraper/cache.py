@@ -0,0 +1,232 @@
+# -*- coding: utf8 -*-
+"""Response cache backends used by fetch functions"""
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from zlib import compress, decompress
+from .consts import *
+
+
+def cache_key(url, method='GET', postdata=None):
+    """Returns cache key for request. Uses url, HTTP method and POST body"""
+    m = hashlib.sha256()
+    m.update(method.upper().encode('utf8'))
+    m.update(url.encode('utf8'))
+    if postdata:
+        if isinstance(postdata, dict):
+            postdata = sorted(postdata.items())
+        m.update(str(postdata).encode('utf8'))
+    return m.hexdigest()
+
+
+def content_digest(content):
+    """Returns hash of page content, used as parsed trees cache key"""
+    if isinstance(content, str):
+        content = content.encode('utf8')
+    return hashlib.sha1(content).digest()
+
+
+def make_entry(content, headers=None, timeout=DEFAULT_CACHE_TIMEOUT):
+    """Returns cache entry for response content. Keeps ETag and Last-Modified validators from
+    headers"""
+    now = time.time()
+    validators = {}
+    if headers:
+        for name in VALIDATOR_HEADERS:
+            if headers.get(name):
+                validators[name] = headers.get(name)
+    return {'content': content, 'headers': validators,
+            'time': now, 'expires': now + timeout if timeout else None}
+
+
+def refresh_entry(entry, timeout=DEFAULT_CACHE_TIMEOUT):
+    """Returns copy of entry revalidated now, with new expiration time"""
+    now = time.time()
+    entry = dict(entry)
+    entry['time'] = now
+    entry['expires'] = now + timeout if timeout else None
+    return entry
+
+
+def conditional_headers(entry):
+    """Returns If-None-Match / If-Modified-Since headers to revalidate cache entry"""
+    headers = {}
+    if 'ETag' in entry['headers']:
+        headers['If-None-Match'] = entry['headers']['ETag']
+    if 'Last-Modified' in entry['headers']:
+        headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+    return headers
+
+
+def is_fresh(entry):
+    """Returns True if cache entry is not expired"""
+    return entry['expires'] is None or entry['expires'] > time.time()
+
+
+class MemoryCache:
+    """In-process LRU cache limited by total size of cached content in bytes.
+    All backends return expired entries only if stale is True, to revalidate them"""
+    def __init__(self, maxsize=DEFAULT_MEMORY_CACHE_SIZE, timeout=DEFAULT_CACHE_TIMEOUT):
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, stale=False):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if not stale and not is_fresh(entry):
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            self.size += len(entry['content'])
+            while self.size > self.maxsize and len(self.entries) > 1:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.size -= len(entry['content'])
+
+
+class FileCache:
+    """Compressed on-disk cache. Each entry is stored as separate file, so cache persists between
+    runs"""
+    def __init__(self, path=DEFAULT_CACHE_DIR, timeout=DEFAULT_CACHE_TIMEOUT):
+        self.timeout = timeout
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _filename(self, key):
+        return os.path.join(self.path, key[:2], key + '.cache')
+
+    def get(self, key, stale=False):
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                entry = pickle.loads(decompress(f.read()))
+        except (OSError, EOFError, pickle.PickleError, ValueError):
+            return None
+        if not stale and not is_fresh(entry):
+            return None
+        return entry
+
+    def set(self, key, entry):
+        filename = self._filename(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmpname = '%s.%d.%d.tmp' % (filename, os.getpid(), threading.get_ident())
+        with open(tmpname, 'wb') as f:
+            f.write(compress(pickle.dumps(entry)))
+        os.replace(tmpname, filename)
+
+
+class MemcachedCache:
+    """Memcached cache, requires python-binary-memcached"""
+    def __init__(self, host='127.0.0.1', port=11211, timeout=DEFAULT_CACHE_TIMEOUT):
+        self.timeout = timeout
+        try:
+            from bmemcached import Client
+        except ImportError:
+            raise ImportError('python-binary-memcached required for memcached cache')
+        self.client = Client(["%s:%d" % (host, port)])
+
+    def get(self, key, stale=False):
+        c_data = self.client.get(key)
+        if not c_data:
+            return None
+        entry = pickle.loads(decompress(c_data))
+        if not stale and not is_fresh(entry):
+            return None
+        return entry
+
+    def set(self, key, entry):
+        expires = int(entry['expires'] - time.time()) if entry['expires'] else 0
+        if entry['headers']:
+            # entries with validators are kept after expiration for revalidation
+            expires = 0
+        self.client.set(key, compress(pickle.dumps(entry)), time=max(expires, 0))
+
+
+class TreeCache:
+    """In-process LRU cache of parsed documents keyed by content hash. Useful only when same pages
+    are parsed several times. Limited by number of documents and by estimated memory of parsed
+    trees, parsed tree takes about TREE_MEMORY_FACTOR times more memory than its source"""
+    def __init__(self, maxsize=DEFAULT_TREE_CACHE_SIZE, maxentries=DEFAULT_TREE_CACHE_ENTRIES):
+        self.maxsize = maxsize
+        self.maxentries = maxentries
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, digest):
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None:
+                return None
+            self.entries.move_to_end(digest)
+            return entry[0]
+
+    def set(self, digest, root, size):
+        size *= TREE_MEMORY_FACTOR
+        if size > self.maxsize:
+            return
+        with self.lock:
+            if digest in self.entries:
+                return
+            self.entries[digest] = (root, size)
+            self.size += size
+            while self.size > self.maxsize or len(self.entries) > self.maxentries:
+                self.size -= self.entries.popitem(last=False)[1][1]
+
+
+def open_cache(spec, timeout=DEFAULT_CACHE_TIMEOUT):
+    """Opens cache backend by spec: 'memory', 'memory:MAXBYTES', 'disk', 'disk:/path/to/dir' or
+    'memcached:host:port'"""
+    name, _, arg = spec.partition(':')
+    if name == 'memory':
+        return MemoryCache(int(arg) if arg else DEFAULT_MEMORY_CACHE_SIZE, timeout)
+    elif name == 'disk':
+        return FileCache(arg or DEFAULT_CACHE_DIR, timeout)
+    elif name == 'memcached':
+        host, _, port = arg.partition(':')
+        return MemcachedCache(host or '127.0.0.1', int(port) if port else 11211, timeout)
+    raise ValueError('Unknown cache backend %s' % (name))
+
+
+_cache = None
+
+
+def set_cache(cache):
+    """Sets cache used by fetch functions. None disables caching"""
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    """Returns cache used by fetch functions or None"""
+    return _cache
+
+
+_tree_cache = None
+
+
+def set_tree_cache(cache):
+    """Sets parsed trees cache used by fetch functions, disabled by default. None disables it"""
+    global _tree_cache
+    _tree_cache = cache
+
+
+def get_tree_cache():
+    """Returns parsed trees cache used by fetch functions or None"""
+    return _tree_cache
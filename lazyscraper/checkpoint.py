@@ -0,0 +1,50 @@
+# -*- coding: utf8 -*-
+"""Checkpoint store of completed pages, lets long paginated jobs resume after failure"""
+import json
+import sqlite3
+import threading
+
+
+class Checkpoint:
+    """SQLite store of completed pages and their items. Without resume previous checkpoint is
+    cleared. On resume pages found in checkpoint are not fetched again, their items are returned
+    from checkpoint if replay is True or skipped if output is appended"""
+    def __init__(self, path, resume=False, replay=True):
+        self.path = path
+        self.resume = resume
+        self.replay = replay
+        self.outputs = []
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, items TEXT)')
+        if not resume:
+            self.conn.execute('DELETE FROM pages')
+        self.conn.commit()
+
+    def get(self, key):
+        """Returns items of completed page or None"""
+        with self.lock:
+            row = self.conn.execute('SELECT items FROM pages WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def add_output(self, io):
+        """Adds output flushed before each page is recorded, so pages are not recorded before their
+        items are written out"""
+        self.outputs.append(io)
+
+    def save(self, key, items):
+        """Records page as completed with its items"""
+        for io in self.outputs:
+            io.flush()
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO pages (key, items) VALUES (?, ?)',
+                              (key, json.dumps(items)))
+            self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,6 +1,7 @@
 # -*- coding: utf8 -*-
 
-DEFAULT_USER_AGENT ="Mozilla/5.0 (Linux; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/67.0.3396.99 Mobile Safari/537.36"
+DEFAULT_USER_AGENT ="Mozilla/5.0 (Linux; Nexus 5 Build/MRA58N) AppleWebKit/537.36 " \
+                    "(KHTML, like Gecko) Chrome/67.0.3396.99 Mobile Safari/537.36"
 DEFAULT_URL_FIELDS = ['_text', 'href']
 DEFAULT_SELECT_FIELDS = ['_text', 'value']
 TEXT_FIELD = "_text"
@@ -8,3 +9,39 @@ TAG_FIELD = "_tag"
 DEFAULT_FIELDS = ['_tag', 'class', 'id', '_text']
 URL_TAG_TYPES = ['href', 'src', 'srcset']
 DEFAULT_CACHE_TIMEOUT = 3600
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 0
+DEFAULT_BACKOFF = 0.5
+RETRY_STATUSES = [500, 502, 503, 504]
+DEFAULT_MEMORY_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_DIR = '.lscraper_cache'
+VALIDATOR_HEADERS = ['ETag', 'Last-Modified']
+DEFAULT_TREE_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_TREE_CACHE_ENTRIES = 32
+TREE_MEMORY_FACTOR = 15
+DEFAULT_XPATH_CACHE_SIZE = 256
+STREAM_CHUNK_SIZE = 64 * 1024
+SOURCE_URL_FIELD = '_url'
+DEFAULT_ASYNC_CONNECTIONS = 20
+THROTTLE_STATUSES = [429, 503]
+DEFAULT_LIMIT_BACKOFF = 1.0
+DEFAULT_LIMIT_MAX_BACKOFF = 60.0
+DEFAULT_LIMIT_RETRIES = 3
+DEFAULT_BATCH_SIZE = 10000
+TABLE_SECTIONS = ('thead', 'tbody', 'tfoot')
+DATA_SECTIONS = ('tbody',)
+MAX_TABLE_SPAN = 1000
+TABLE_CELLS = ('td', 'th')
+TABLE_ID_FIELD = '_table'
+TABLE_XPATH = '//table%s'
+NEXT_LINK_XPATH = "//link[contains(concat(' ', normalize-space(@rel), ' '), ' next ')]/@href | " \
+                  "//a[contains(concat(' ', normalize-space(@rel), ' '), ' next ')]/@href"
+DEFAULT_FOLLOW_XPATH = '//a/@href'
+DEFAULT_CRAWL_DEPTH = 1
+DEFAULT_BLOOM_CAPACITY = 10000000
+DEFAULT_BLOOM_ERROR_RATE = 0.001
+APPENDABLE_FORMATS = ['text', 'csv', 'ndjson', 'jsonl']
+DEFAULT_MAX_TASKS_PER_CHILD = 500
+DEFAULT_METRICS_PORT = 9108
+DEFAULT_METRICS_INTERVAL = 15.0
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
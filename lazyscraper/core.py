@@ -3,30 +3,16 @@
 """Lazy scraping tool"""
 import json
 import os
-import hashlib
-import zlib
-import time
-import csv
 import logging
-import datetime
-import io
 import sys
-from urllib.request import urlopen
-from urllib.parse import urljoin
-import requests
-import lxml.html
-import lxml.etree
 import click
-from io import StringIO
-try:
-    from bmemcached import Client
-    from zlib import compress, decompress
-except:
-    pass
 
-from lazyscraper.scraper import  use_pattern, extract_data_xpath, get_table
-from lazyscraper.patterns import PATTERNS
-from lazyscraper.consts import DEFAULT_FIELDS, DEFAULT_USER_AGENT
+from lazyscraper.consts import DEFAULT_MAX_TASKS_PER_CHILD, SOURCE_URL_FIELD, TABLE_ID_FIELD, \
+    TABLE_XPATH, DEFAULT_FOLLOW_XPATH, DEFAULT_CRAWL_DEPTH, DEFAULT_FIELDS, DEFAULT_USER_AGENT, \
+    DEFAULT_POOL_SIZE, DEFAULT_RETRIES, DEFAULT_BACKOFF, DEFAULT_CACHE_TIMEOUT
+
+# Scraper, HTTP and output modules are imported by commands and helpers that use them, so --help and
+# local file runs do not pay for loading of requests, lxml or pyarrow
 
 #logging.getLogger().addHandler(logging.StreamHandler())
 logging.basicConfig(
@@ -34,6 +20,258 @@ logging.basicConfig(
         level=logging.DEBUG)
 
 
+def http_options(func):
+    """Adds shared HTTP session options to the command"""
+    options = [
+        click.option('--pool-size', default=DEFAULT_POOL_SIZE, type=int,
+                     help='Max kept alive connections per host'),
+        click.option('--retries', default=DEFAULT_RETRIES, type=int,
+                     help='Number of retries of failed requests'),
+        click.option('--backoff', default=DEFAULT_BACKOFF, type=float,
+                     help='Backoff factor between retries, seconds'),
+        click.option('--cache', default=None,
+                     help='Response cache: memory, disk, disk:PATH or memcached:HOST:PORT'),
+        click.option('--cache-ttl', default=DEFAULT_CACHE_TIMEOUT, type=int,
+                     help='Cache entries time to live, seconds'),
+        click.option('--rate', default=None, type=float, help='Max requests per second per host'),
+        click.option('--max-per-host', default=None, type=int,
+                     help='Max concurrent requests per host'),
+        click.option('--tree-cache', is_flag=True, default=False,
+                     help='Keep parsed pages in memory and reuse them for pages with same content'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def follow_options(func):
+    """Adds next page link following options to the command"""
+    options = [
+        click.option('--follow-next', is_flag=True, default=False,
+                     help='Follow next page links with rel=next instead of pagekey'),
+        click.option('--next-xpath', default=None,
+                     help='XPath of next page link to follow instead of pagekey'),
+        click.option('--max-pages', default=None, type=int, help='Max number of pages to follow'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def checkpoint_options(func):
+    """Adds checkpoint options to the command"""
+    options = [
+        click.option('--checkpoint', default=None,
+                     help='Checkpoint file recording completed pages'),
+        click.option('--resume', is_flag=True, default=False,
+                     help='Resume from checkpoint, completed pages are not fetched again'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def open_checkpoint(checkpoint, resume, output=None, format=None, pagekey=None, follow=None,
+                    urls_file=None):
+    """Returns checkpoint store and True if output should be appended. On resume output in csv or
+    ndjson is appended with new pages only, other outputs are rewritten with items of completed
+    pages from checkpoint. Only pages of pagekey pagination are recorded, so checkpoint requires
+    pagekey. Batch mode collects all pages of url before they are written, so it is not
+    supported"""
+    if not checkpoint:
+        if resume:
+            raise click.UsageError('--resume requires --checkpoint')
+        return None, False
+    if not pagekey or follow:
+        raise click.UsageError('--checkpoint requires --pagekey and could not be used with next '
+                               'links following')
+    if urls_file:
+        raise click.UsageError('--checkpoint could not be used with --urls-file')
+    from lazyscraper.writers import is_appendable
+    from lazyscraper.checkpoint import Checkpoint
+    append = resume and output is not None and is_appendable(format) and \
+        os.path.exists(output) and os.path.getsize(output) > 0
+    return Checkpoint(checkpoint, resume, replay=not append), append
+
+
+def parse_options(func):
+    """Adds parse process pool options to the command"""
+    options = [
+        click.option('--processes', default=0, type=int,
+                     help='Number of worker processes parsing pages, 0 to parse in main process. '
+                          '--workers is raised to it if lower'),
+        click.option('--max-tasks', default=DEFAULT_MAX_TASKS_PER_CHILD, type=int,
+                     help='Pages parsed by worker process before it is replaced'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def setup_parse(processes=0, max_tasks=DEFAULT_MAX_TASKS_PER_CHILD, xpaths=None, workers=1):
+    """Starts parse process pool if processes set. Pool is closed when command finishes. Returns
+    number of pages fetched in parallel, at least processes, as each fetching thread waits for its
+    page to be parsed and fewer threads leave worker processes idle"""
+    from lazyscraper.procpool import ParsePool, set_parse_pool
+    if not processes:
+        set_parse_pool(None)
+        return workers
+    pool = ParsePool(processes, max_tasks, xpaths)
+    set_parse_pool(pool)
+    click.get_current_context().call_on_close(pool.terminate)
+    return max(workers, processes)
+
+
+def stats_options(func):
+    """Adds stats and profiling options to the command"""
+    options = [
+        click.option('--stats', is_flag=True, default=False,
+                     help='Print timings of stages, bytes and cache counters at the end'),
+        click.option('--profile', default=None, help='Save profile of the run to file'),
+        click.option('--profiler', default='cprofile',
+                     type=click.Choice(['cprofile', 'pyinstrument']),
+                     help='Profiler: cprofile (main thread only, view with pstats) or pyinstrument '
+                          '(text report)'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def setup_stats(stats=False, profile=None, profiler='cprofile'):
+    """Starts stats collection and profiler. Stats are printed to stderr and profile saved when
+    command finishes"""
+    from lazyscraper.stats import Stats, set_stats
+    ctx = click.get_current_context()
+    if stats:
+        collector = Stats()
+        set_stats(collector)
+        ctx.call_on_close(lambda: click.echo(collector.report(), err=True))
+    else:
+        set_stats(None)
+    if not profile:
+        return
+    if profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise click.UsageError('pyinstrument required for --profiler pyinstrument')
+        prof = Profiler()
+        prof.start()
+
+        def save():
+            prof.stop()
+            with open(profile, 'w', encoding='utf8') as f:
+                f.write(prof.output_text(unicode=True))
+    else:
+        import cProfile
+        prof = cProfile.Profile()
+        prof.enable()
+
+        def save():
+            prof.disable()
+            prof.dump_stats(profile)
+    ctx.call_on_close(save)
+
+
+def metrics_options(func):
+    """Adds Prometheus metrics options to the command"""
+    options = [
+        click.option('--metrics-port', default=None, type=int,
+                     help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics while '
+                          'running'),
+        click.option('--metrics-file', default=None,
+                     help='Write Prometheus metrics to file for node_exporter textfile collector'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def setup_metrics(metrics_port=None, metrics_file=None):
+    """Starts metrics collection, HTTP endpoint and textfile writer. Both are stopped when command
+    finishes, metrics file is written once more with final values"""
+    from lazyscraper.metrics import set_metrics
+    if not metrics_port and not metrics_file:
+        set_metrics(None)
+        return
+    from lazyscraper.metrics import Metrics, start_http_server, TextfileWriter
+    ctx = click.get_current_context()
+    set_metrics(Metrics())
+    if metrics_port:
+        ctx.call_on_close(start_http_server(metrics_port).stop)
+    if metrics_file:
+        ctx.call_on_close(TextfileWriter(metrics_file).start().stop)
+
+
+def setup_http(workers=1, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+               backoff=DEFAULT_BACKOFF, cache=None, cache_ttl=DEFAULT_CACHE_TIMEOUT, rate=None,
+               max_per_host=None, tree_cache=False):
+    """Configures shared HTTP session, response cache, parsed trees cache and rate limiter from
+    command options. Session is created on the first request, so runs over local files do not load
+    HTTP stack"""
+    from lazyscraper.urltools import configure_session
+    from lazyscraper.cache import open_cache, set_cache, TreeCache, set_tree_cache
+    from lazyscraper.ratelimit import RateLimiter, set_rate_limiter
+    configure_session(max(pool_size, workers), retries, backoff, lazy=True)
+    set_cache(open_cache(cache, cache_ttl) if cache else None)
+    set_tree_cache(TreeCache() if tree_cache else None)
+    if rate or max_per_host:
+        set_rate_limiter(RateLimiter(rate, max_concurrent=max_per_host))
+    else:
+        set_rate_limiter(None)
+
+
+def open_output(output, format=None, append=False):
+    """Opens output file or stdout for writing, in binary mode for binary formats"""
+    from lazyscraper.writers import is_binary
+    if is_binary(format):
+        return open(output or sys.stdout.fileno(), 'wb')
+    if output:
+        return open(output, 'a' if append else 'w', encoding='utf8')
+    return open(sys.stdout.fileno(), mode='w', encoding='utf8', buffering=1)
+
+
+def read_urls(io):
+    """Reads urls from file, one per line. Empty lines and lines started with # are skipped"""
+    for line in io:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def tag_tables(tables):
+    """Adds table id to (table id, row) items: as TABLE_ID_FIELD key of dict rows or as the first
+    value of list rows"""
+    for tableid, row in tables:
+        if isinstance(row, dict):
+            row[TABLE_ID_FIELD] = tableid
+            yield row
+        else:
+            yield [tableid] + list(row)
+
+
+def write_tables(output, tables, format, fields=None, dictrows=False, pretty=False,
+                 checkpoint=None):
+    """Writes each table of (table id, row) items to separate file, output is filename template with
+    {table}. Files are flushed before checkpoint records a page"""
+    from lazyscraper.writers import get_writer
+    outputs = {}
+    writers = {}
+    try:
+        for tableid, row in tables:
+            if tableid not in writers:
+                outputs[tableid] = open_output(output.format(table=tableid), format)
+                if checkpoint is not None:
+                    checkpoint.add_output(outputs[tableid])
+                writers[tableid] = get_writer(format, outputs[tableid], fields, dictrows, pretty,
+                                              sort_keys=not dictrows)
+            writers[tableid].write(row)
+        for writer in writers.values():
+            writer.close()
+    finally:
+        for io in outputs.values():
+            io.close()
 
 
 @click.group()
@@ -42,35 +280,58 @@ def cli1():
 
 @cli1.command()
 @click.option('--url', default=None, help='URL to parse')
+@click.option('--urls-file', default=None, type=click.File('r', encoding='utf8'),
+              help='File with urls to parse, one per line, - for stdin')
 @click.option('--localfile', default=None, help='Path to filename')
 @click.option('--xpath', default='//a', help='Xpath')
 @click.option('--fieldnames', default=None, help='Fieldnames. If not set, default names used')
 @click.option('--absolutize', default=False, help='Absolutize urls')
 @click.option('--post', default=False, help='Use post request')
 @click.option('--pagekey', default=None, help='Pagination url/post parameter')
-@click.option('--pagerange', default=None, help='Pagination range as start,end,step, like "1,24,1"')
-@click.option('--format', default='text', help='Output format')
+@click.option('--pagerange', default=None,
+              help='Pagination range as start,end,step,pagesize, like "1,24,1,-1"')
+@click.option('--workers', default=1, type=int,
+              help='Number of pages (or urls with --urls-file) fetched in parallel')
+@click.option('--stream', is_flag=True, default=False,
+              help='Parse page incrementally, only for xpath like //tag[...]')
+@click.option('--format', default='text',
+              help='Output format: text, csv, json, ndjson, jsonl, parquet or arrow')
+@click.option('--pretty', is_flag=True, default=False, help='Pretty print JSON output')
 @click.option('--output', default=None, help='Output filename')
-def extract(url, localfile, xpath, fieldnames, absolutize, post, pagekey, pagerange, format, output):
+@follow_options
+@checkpoint_options
+@parse_options
+@stats_options
+@metrics_options
+@http_options
+def extract(url, urls_file, localfile, xpath, fieldnames, absolutize, post, pagekey, pagerange,
+            workers, stream, format, pretty, output, follow_next, next_xpath, max_pages, checkpoint,
+            resume, processes, max_tasks, stats, profile, profiler, metrics_port, metrics_file,
+            **http):
     """Extract data with xpath"""
+    from lazyscraper.scraper import iter_extract_data_xpath, iter_batch
+    from lazyscraper.writers import write_items
+    setup_stats(stats, profile, profiler)
+    setup_metrics(metrics_port, metrics_file)
+    workers = setup_parse(processes, max_tasks, [xpath], workers)
+    setup_http(workers, **http)
+    follow = next_xpath or follow_next
+    checkpoint, append = open_checkpoint(checkpoint, resume, output, format, pagekey, follow,
+                                         urls_file)
     fields = fieldnames.split(',') if fieldnames else DEFAULT_FIELDS
-    data = extract_data_xpath(url, localfile, xpath, fieldnames, absolutize, post, pagekey, pagerange)
-    if output:
-        io = open(output, 'w', encoding='utf8')
+    if urls_file:
+        fields = [SOURCE_URL_FIELD] + fields
+        data = iter_batch(iter_extract_data_xpath, read_urls(urls_file), workers, None, xpath,
+                          fieldnames, absolutize, post, pagekey, pagerange, stream=stream,
+                          follow=follow, maxpages=max_pages)
     else:
-        io =  open(sys.stdout.fileno(), mode='w', encoding='utf8', buffering=1)
-    if format == 'text':
-        writer = csv.DictWriter(io, fieldnames=fields)
-        writer.writeheader()
-        for item in data:
-            writer.writerow(item)
-    elif format == 'csv':
-        writer = csv.DictWriter(io, fieldnames=fields)
-        writer.writeheader()
-        for item in data:
-            writer.writerow(item)
-    elif format == 'json':
-        io.write(json.dumps(data, indent=4 ))
+        data = iter_extract_data_xpath(url, localfile, xpath, fieldnames, absolutize, post, pagekey,
+                                       pagerange, workers=workers, stream=stream, follow=follow,
+                                       maxpages=max_pages, checkpoint=checkpoint)
+    with open_output(output, format, append) as io:
+        if checkpoint is not None:
+            checkpoint.add_output(io)
+        write_items(io, data, format, fields, pretty=pretty, header=not append)
 
 @click.group()
 def cli2():
@@ -78,40 +339,64 @@ def cli2():
 
 @cli2.command()
 @click.option('--url', default='url', help='URL to parse')
+@click.option('--urls-file', default=None, type=click.File('r', encoding='utf8'),
+              help='File with urls to parse, one per line, - for stdin')
 @click.option('--pattern', default='simpleul', help='Scraper pattern')
 @click.option('--nodeid', default=None, help='Node id in html')
 @click.option('--nodeclass', default=None, help='Node "class" in html')
 @click.option('--fieldnames', default=None, help='Fieldnames. If not set, default names used')
 @click.option('--absolutize', default=False, help='Absolutize urls')
-@click.option('--format', default='text', help='Output format')
+@click.option('--format', default='text',
+              help='Output format: text, csv, json, ndjson, jsonl, parquet or arrow')
+@click.option('--pretty', is_flag=True, default=False, help='Pretty print JSON output')
 @click.option('--pagekey', default='', help='Pagination url parameter')
 @click.option('--pagerange', default=None, help='Pagination range as start,end,step, like "1,24,1"')
+@click.option('--workers', default=1, type=int,
+              help='Number of pages (or urls with --urls-file) fetched in parallel')
 @click.option('--output', default=None, help='Output filename')
-def use(url, pattern, nodeid, nodeclass, fieldnames, absolutize, format, pagekey, pagerange, output):
+@follow_options
+@checkpoint_options
+@parse_options
+@stats_options
+@metrics_options
+@http_options
+def use(url, urls_file, pattern, nodeid, nodeclass, fieldnames, absolutize, format, pretty, pagekey,
+        pagerange, workers, output, follow_next, next_xpath, max_pages, checkpoint, resume,
+        processes, max_tasks, stats, profile, profiler, metrics_port, metrics_file, **http):
     """Uses predefined pattern to extract page data"""
+    from lazyscraper.scraper import use_pattern, iter_use_pattern, iter_batch
+    from lazyscraper.patterns import PATTERNS, pattern_xpaths
+    from lazyscraper.writers import write_items
+    setup_stats(stats, profile, profiler)
+    setup_metrics(metrics_port, metrics_file)
+    workers = setup_parse(processes, max_tasks, pattern_xpaths(pattern, nodeclass, nodeid), workers)
+    setup_http(workers, **http)
     pat = PATTERNS[pattern]
     fields = fieldnames.split(',') if fieldnames else pat['deffields']
-    findata = use_pattern(url, pattern, nodeid, nodeclass, fieldnames, absolutize, pagekey, pagerange)
-
-    if pat['json_only']: format = 'json'
-
-    if output:
-        io = open(output, 'w', encoding='utf8')
+    follow = next_xpath or follow_next
+    if pat['json_only'] and format not in ['json', 'ndjson', 'jsonl']:
+        format = 'json'
+    checkpoint, append = open_checkpoint(checkpoint, resume, output, format, pagekey, follow,
+                                         urls_file)
+    if pat['json_only'] and format == 'json' and not pagekey and not urls_file and not follow:
+        findata = use_pattern(url, pattern, nodeid, nodeclass, fieldnames, absolutize, pagekey,
+                              pagerange, workers=workers)
+        with open_output(output) as io:
+            io.write(json.dumps(findata, indent=4 if pretty else None))
+        return
+    if urls_file:
+        fields = [SOURCE_URL_FIELD] + fields if fields else None
+        findata = iter_batch(iter_use_pattern, read_urls(urls_file), workers, pattern, nodeid,
+                             nodeclass, fieldnames, absolutize, pagekey, pagerange, follow=follow,
+                             maxpages=max_pages)
     else:
-        io =  open(sys.stdout.fileno(), mode='w', encoding='utf8', buffering=1)
-    if format == 'text':
-        writer = csv.DictWriter(io, fieldnames=fields)
-        writer.writeheader()
-        for item in findata:
-            writer.writerow(item)
-    elif format == 'csv':
-        writer = csv.DictWriter(io, fieldnames=fields)
-        writer.writeheader()
-        for item in findata:
-            writer.writerow(item)
-    elif format == 'json':
-        io.write(json.dumps(findata, indent=4 ))
-    pass
+        findata = iter_use_pattern(url, pattern, nodeid, nodeclass, fieldnames, absolutize, pagekey,
+                                   pagerange, workers=workers, follow=follow, maxpages=max_pages,
+                                   checkpoint=checkpoint)
+    with open_output(output, format, append) as io:
+        if checkpoint is not None:
+            checkpoint.add_output(io)
+        write_items(io, findata, format, fields, pretty=pretty, header=not append)
 
 
 @click.group()
@@ -119,39 +404,203 @@ def cli3():
     pass
 
 @cli3.command()
-@click.option('--url', default='url', help='URL to parse')
+@click.option('--url', default=None, help='URL to parse')
+@click.option('--urls-file', default=None, type=click.File('r', encoding='utf8'),
+              help='File with urls to parse, one per line, - for stdin')
+@click.option('--localfile', default=None, help='Path to filename')
 @click.option('--agent', default=DEFAULT_USER_AGENT, help='User agent')
 @click.option('--nodeid', default=None, help='Node id in html')
 @click.option('--nodeclass', default=None, help='Node "class" in html')
 @click.option('--fieldnames', default=None, help='Fieldnames. If not set, default names used')
-@click.option('--format', default='text', help='Output format')
+@click.option('--format', default='text',
+              help='Output format: text, csv, json, ndjson, jsonl, parquet or arrow')
+@click.option('--pretty', is_flag=True, default=False, help='Pretty print JSON output')
 @click.option('--pagekey', default=None, help='Pagination url parameter')
-@click.option('--pagerange', default='1,1,1', help='Pagination range as start,end,step, like "1,24,1"')
+@click.option('--pagerange', default='1,1,1,-1',
+              help='Pagination range as start,end,step,pagesize, like "1,24,1,-1"')
+@click.option('--workers', default=1, type=int,
+              help='Number of pages (or urls with --urls-file) fetched in parallel')
+@click.option('--stream', is_flag=True, default=False,
+              help='Parse page incrementally, keeps in memory only current row')
+@click.option('--headerrow', is_flag=True, default=False,
+              help='Use table headers from thead or th cells as columns names, same as --headers. '
+                   'Data rows are never used as header')
+@click.option('--headers', is_flag=True, default=False,
+              help='Rows as records keyed by table headers from thead or th cells')
+@click.option('--index', default=0, type=int,
+              help='Number of table with nodeid or nodeclass in document order, starting from 0')
+@click.option('--all-tables', is_flag=True, default=False,
+              help='Extract all tables with nodeid or nodeclass. Rows are tagged with table id '
+                   'or, if output has {table} in name, each table written to its own file')
 @click.option('--output', default=None, help='Output filename')
-def gettable(url, agent, nodeid, nodeclass, fieldnames, format, pagekey, pagerange, output):
+@follow_options
+@checkpoint_options
+@parse_options
+@stats_options
+@metrics_options
+@http_options
+def gettable(url, urls_file, localfile, agent, nodeid, nodeclass, fieldnames, format, pretty,
+             pagekey, pagerange, workers, stream, headerrow, headers, index, all_tables, output,
+             follow_next, next_xpath, max_pages, checkpoint, resume, processes, max_tasks, stats,
+             profile, profiler, metrics_port, metrics_file, **http):
     """Extracts table with data from html"""
-    findata = get_table(url, nodeid, nodeclass, pagekey, pagerange, agent=agent)
-
-    if output:
-        io = open(output, 'w', encoding='utf8')
+    from lazyscraper.scraper import iter_get_table, iter_get_tables, iter_batch
+    from lazyscraper.htmltools import node_xpath
+    from lazyscraper.writers import write_items
+    setup_stats(stats, profile, profiler)
+    setup_metrics(metrics_port, metrics_file)
+    follow = next_xpath or follow_next
+    headers = headers or headerrow
+    if stream and (all_tables or index):
+        raise click.UsageError('--stream supports only the first table')
+    split = all_tables and output is not None and '{table}' in output
+    if split and urls_file:
+        raise click.UsageError('--urls-file could not be used with per table output files')
+    workers = setup_parse(processes, max_tasks, [node_xpath(TABLE_XPATH, nodeclass, nodeid)],
+                          workers)
+    setup_http(workers, **http)
+    checkpoint, append = open_checkpoint(checkpoint, resume, None if split else output, format,
+                                         pagekey, follow, urls_file)
+    fields = fieldnames.split(',') if fieldnames else None
+    if all_tables and not split:
+        fields = [TABLE_ID_FIELD] + fields if fields else None
+    if urls_file:
+        fields = [SOURCE_URL_FIELD] + fields if fields else None
+        if all_tables:
+            findata = iter_batch(lambda anurl, *args, **kwargs:
+                                 tag_tables(iter_get_tables(anurl, *args, **kwargs)),
+                                 read_urls(urls_file), workers, nodeid, nodeclass, pagekey,
+                                 pagerange, agent=agent, headers=headers, follow=follow,
+                                 maxpages=max_pages)
+        else:
+            findata = iter_batch(iter_get_table, read_urls(urls_file), workers, nodeid, nodeclass,
+                                 pagekey, pagerange, agent=agent, stream=stream, headers=headers,
+                                 index=index, follow=follow, maxpages=max_pages)
+    elif all_tables:
+        findata = iter_get_tables(url, nodeid, nodeclass, pagekey, pagerange, agent=agent,
+                                  workers=workers, filename=localfile, headers=headers,
+                                  follow=follow, maxpages=max_pages, checkpoint=checkpoint)
+        if split:
+            write_tables(output, findata, format, fields, dictrows=headers, pretty=pretty,
+                         checkpoint=checkpoint)
+            return
+        findata = tag_tables(findata)
     else:
-        io =  open(sys.stdout.fileno(), mode='w', encoding='utf8', buffering=1)
-    if format == 'text':
-        writer = csv.writer(io)
-        if fieldnames:
-            writer.writerow(fieldnames.split(','))
-        for item in findata:
-            writer.writerow(item)
-    elif format == 'csv':
-        writer = csv.writer(io)
-        if fieldnames:
-            writer.writerow(fieldnames.split(','))
-        for item in findata:
-            writer.writerow(item)
-    elif format == 'json':
-        io.write(json.dumps(findata, sort_keys=True, indent=4 ))
+        findata = iter_get_table(url, nodeid, nodeclass, pagekey, pagerange, agent=agent,
+                                 workers=workers, filename=localfile, stream=stream,
+                                 headers=headers, index=index, follow=follow, maxpages=max_pages,
+                                 checkpoint=checkpoint)
+    with open_output(output, format, append) as io:
+        if checkpoint is not None:
+            checkpoint.add_output(io)
+        write_items(io, findata, format, fields, dictrows=headers, pretty=pretty,
+                    sort_keys=not headers, header=not append)
+
+
+@click.group()
+def cli4():
     pass
 
 
-cli = click.CommandCollection(sources=[cli1, cli2, cli3])
+@cli4.command()
+@click.option('--job', required=True, help='Job file, YAML or JSON, with url and named extractors')
+@click.option('--workers', default=None, type=int,
+              help='Number of pages fetched in parallel, overrides job setting')
+@checkpoint_options
+@parse_options
+@stats_options
+@metrics_options
+@http_options
+def run(job, workers, checkpoint, resume, processes, max_tasks, stats, profile, profiler,
+        metrics_port, metrics_file, **http):
+    """Runs several extractors over single fetch of each page"""
+    from lazyscraper.jobs import load_job, run_job, job_xpaths
+    from lazyscraper.checkpoint import Checkpoint
+    setup_stats(stats, profile, profiler)
+    setup_metrics(metrics_port, metrics_file)
+    job = load_job(job)
+    if workers is not None:
+        job['workers'] = workers
+    job['workers'] = setup_parse(processes, max_tasks, job_xpaths(job), job.get('workers', 1))
+    setup_http(job['workers'], **http)
+    if resume and not checkpoint:
+        raise click.UsageError('--resume requires --checkpoint')
+    if checkpoint and job.get('follow'):
+        raise click.UsageError('--checkpoint could not be used with jobs following next links')
+    counts = run_job(job, checkpoint=Checkpoint(checkpoint, resume) if checkpoint else None)
+    for name, count in counts.items():
+        logging.info('Extractor %s: %d items' % (name, count))
+
+
+@click.group()
+def cli5():
+    pass
+
+
+@cli5.command()
+@click.option('--url', multiple=True, help='Seed URL, could be repeated')
+@click.option('--urls-file', default=None, type=click.File('r', encoding='utf8'),
+              help='File with seed urls, one per line, - for stdin')
+@click.option('--pattern', default=None, help='Scraper pattern applied to every page')
+@click.option('--xpath', default=None,
+              help='Xpath of nodes extracted from every page, if pattern not set')
+@click.option('--nodeid', default=None, help='Node id in html')
+@click.option('--nodeclass', default=None, help='Node "class" in html')
+@click.option('--fieldnames', default=None, help='Fieldnames. If not set, default names used')
+@click.option('--absolutize', default=False, help='Absolutize urls')
+@click.option('--follow', default=DEFAULT_FOLLOW_XPATH, help='XPath of links to follow')
+@click.option('--match', default=None,
+              help='Regular expression, only links matching it are followed')
+@click.option('--depth', default=DEFAULT_CRAWL_DEPTH, type=int,
+              help='Max number of links from seed url to follow')
+@click.option('--domain', multiple=True,
+              help='Allowed domain with its subdomains, could be repeated. Seed domains by default')
+@click.option('--max-pages', default=None, type=int, help='Max number of pages to crawl')
+@click.option('--visited', default='set',
+              help='Visited urls set: set or bloom[:CAPACITY] for millions of urls')
+@click.option('--workers', default=1, type=int, help='Number of pages fetched in parallel')
+@click.option('--agent', default=DEFAULT_USER_AGENT, help='User agent')
+@click.option('--format', default='text',
+              help='Output format: text, csv, json, ndjson, jsonl, parquet or arrow')
+@click.option('--pretty', is_flag=True, default=False, help='Pretty print JSON output')
+@click.option('--output', default=None, help='Output filename')
+@stats_options
+@metrics_options
+@http_options
+def crawl(url, urls_file, pattern, xpath, nodeid, nodeclass, fieldnames, absolutize, follow, match,
+          depth, domain, max_pages, visited, workers, agent, format, pretty, output, stats, profile,
+          profiler, metrics_port, metrics_file, **http):
+    """Crawls site from seed urls and extracts data from every page"""
+    from lazyscraper.crawler import iter_crawl, pattern_extractor, xpath_extractor, open_visited
+    from lazyscraper.patterns import PATTERNS
+    from lazyscraper.writers import write_items
+    setup_stats(stats, profile, profiler)
+    setup_metrics(metrics_port, metrics_file)
+    seeds = list(url) + (list(read_urls(urls_file)) if urls_file else [])
+    if not seeds:
+        raise click.UsageError('--url or --urls-file required')
+    setup_http(workers, **http)
+    if pattern:
+        extract = pattern_extractor(pattern, nodeid, nodeclass, fieldnames, absolutize)
+        fields = fieldnames.split(',') if fieldnames else PATTERNS[pattern]['deffields']
+        if PATTERNS[pattern]['json_only'] and format not in ['json', 'ndjson', 'jsonl']:
+            format = 'json'
+    else:
+        extract = xpath_extractor(xpath or '//a', fieldnames, absolutize)
+        fields = fieldnames.split(',') if fieldnames else DEFAULT_FIELDS
+    fields = [SOURCE_URL_FIELD] + fields if fields else None
+
+    def items():
+        for anurl, level, page in iter_crawl(seeds, extract, follow, match, depth,
+                                             list(domain) or None, workers, max_pages,
+                                             open_visited(visited), agent):
+            for item in page:
+                item[SOURCE_URL_FIELD] = anurl
+                yield item
+
+    with open_output(output, format) as io:
+        write_items(io, items(), format, fields, pretty=pretty)
+
+
+cli = click.CommandCollection(sources=[cli1, cli2, cli3, cli4, cli5])
 
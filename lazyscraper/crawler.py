@@ -0,0 +1,219 @@
+# -*- coding: utf8 -*-
+"""Link graph crawler. Starts from seed urls, follows links selected by XPath and matching regex
+within allowed domains up to max depth, and extracts data from every fetched page with pattern or
+xpath"""
+import re
+import math
+import hashlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin, urlsplit, urlunsplit, urldefrag
+
+from .consts import *
+from .htmltools import compiled_xpath
+from .urltools import get_cached_url
+from .scraper import extract_xpath_page, extract_pattern_page, _absolutize_func
+from .patterns import PATTERNS
+from . import metrics
+
+
+def normalize_url(url):
+    """Returns url without fragment, with lowercase scheme and host and with / as empty path"""
+    parts = urlsplit(urldefrag(url)[0])
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.query,
+                       ''))
+
+
+def _url_hash(url):
+    return int.from_bytes(hashlib.blake2b(url.encode('utf8'), digest_size=8).digest(), 'little')
+
+
+class VisitedSet:
+    """Set of visited urls keeping only 64 bit hash of each url"""
+    def __init__(self):
+        self.hashes = set()
+
+    def add(self, url):
+        """Adds url. Returns False if url was already added"""
+        h = _url_hash(url)
+        if h in self.hashes:
+            return False
+        self.hashes.add(h)
+        return True
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+class BloomFilter:
+    """Bloom filter of visited urls with fixed memory for capacity urls. Some new urls are reported
+    as visited with error_rate probability"""
+    def __init__(self, capacity=DEFAULT_BLOOM_CAPACITY, error_rate=DEFAULT_BLOOM_ERROR_RATE):
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, url):
+        digest = hashlib.blake2b(url.encode('utf8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, url):
+        """Adds url. Returns False if url was (probably) already added"""
+        added = False
+        for pos in self._positions(url):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __len__(self):
+        return self.count
+
+
+def open_visited(spec=None):
+    """Returns visited urls set by spec: set (default) or bloom[:CAPACITY]"""
+    if not spec or spec == 'set':
+        return VisitedSet()
+    if spec == 'bloom':
+        return BloomFilter()
+    if spec.startswith('bloom:'):
+        return BloomFilter(int(spec.split(':', 1)[1]))
+    raise ValueError('Unknown visited set %s' % (spec))
+
+
+def _in_domains(url, domains):
+    host = urlsplit(url).hostname or ''
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+def page_links(root, url, follow=DEFAULT_FOLLOW_XPATH, match=None):
+    """Returns absolute http(s) urls of links on parsed page selected by follow XPath, elements with
+    href or strings, and matching regex match if set"""
+    links = []
+    for result in compiled_xpath(follow)(root.getroottree()):
+        href = result.get('href') if hasattr(result, 'get') else str(result)
+        if not href:
+            continue
+        link = normalize_url(urljoin(url, href.strip()))
+        if link[:7] != 'http://' and link[:8] != 'https://':
+            continue
+        if match is not None and not match.search(link):
+            continue
+        links.append(link)
+    return links
+
+
+def pattern_extractor(pattern, nodeid=None, nodeclass=None, fieldnames=None, absolutize=False):
+    """Returns extract(root, url) function applying pattern to crawled page"""
+    fields = fieldnames.split(',') if fieldnames else PATTERNS[pattern]['deffields']
+
+    def extract(root, url):
+        items = extract_pattern_page(root, pattern, nodeclass, nodeid, fields)
+        if isinstance(items, dict):
+            return [items]
+        fix = _absolutize_func(url, fields, absolutize)
+        return [fix(item) for item in items] if fix else items
+    return extract
+
+
+def xpath_extractor(xpath, fieldnames=None, absolutize=False):
+    """Returns extract(root, url) function extracting nodes selected by xpath from crawled page"""
+    fields = fieldnames.split(',') if fieldnames else DEFAULT_FIELDS
+
+    def extract(root, url):
+        items = extract_xpath_page(root, xpath, fields)
+        fix = _absolutize_func(url, fields, absolutize)
+        return [fix(item) for item in items] if fix else items
+    return extract
+
+
+def iter_crawl(seeds, extract, follow=DEFAULT_FOLLOW_XPATH, match=None, depth=1, domains=None,
+               workers=1, maxpages=None, visited=None, agent=None):
+    """Crawls pages starting from seeds. Links selected by follow XPath and matching regex match are
+    followed up to depth links from seed, only within domains (seeds domains by default) and their
+    subdomains. Up to workers pages are fetched and parsed in parallel, pages are processed breadth
+    first
+
+    :param seeds:
+        Start urls
+    :type seeds: list
+    :param extract:
+        Function extract(root, url) returning list of items of page, see :func:`pattern_extractor`
+    :type extract: function
+    :param visited:
+        Visited urls set, :class:`VisitedSet` by default or :class:`BloomFilter` for millions of
+        urls
+    :type visited: VisitedSet|BloomFilter
+    :param maxpages:
+        Max number of pages to fetch
+    :type maxpages: int
+
+    :return: Yields (url, depth, items) of each crawled page
+    :rtype: :class:`tuple`."""
+    if visited is None:
+        visited = VisitedSet()
+    if isinstance(match, str):
+        match = re.compile(match)
+    seeds = [normalize_url(url) for url in seeds]
+    if domains is None:
+        domains = [urlsplit(url).hostname for url in seeds]
+    kwargs = {'agent' : agent} if agent else {}
+    frontier = deque()
+    for url in seeds:
+        if visited.add(url):
+            frontier.append((url, 0))
+
+    def process_page(url, level):
+        logging.info('Crawling url %s' % (url))
+        root = get_cached_url(url, **kwargs)
+        links = page_links(root, url, follow, match) if level < depth else []
+        return extract(root, url), links
+
+    executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+    running = {}
+    scheduled = 0
+    try:
+        while frontier or running:
+            while frontier and len(running) < max(workers, 1) and \
+                    (not maxpages or scheduled < maxpages):
+                url, level = frontier.popleft()
+                running[executor.submit(process_page, url, level)] = (url, level)
+                scheduled += 1
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, level = running.pop(future)
+                try:
+                    items, links = future.result()
+                except Exception as e:
+                    logging.warning('Failed to crawl url %s: %s' % (url, e))
+                    continue
+                for link in links:
+                    if _in_domains(link, domains) and visited.add(link):
+                        frontier.append((link, level + 1))
+                metrics.add_rows(len(items))
+                yield url, level, items
+    finally:
+        for future in running:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def crawl(seeds, extract, follow=DEFAULT_FOLLOW_XPATH, match=None, depth=1, domains=None, workers=1,
+          maxpages=None, visited=None, agent=None):
+    """Crawls pages starting from seeds, see :func:`iter_crawl`. Returns list of extracted items,
+    each with SOURCE_URL_FIELD key with url of page"""
+    findata = []
+    for url, level, items in iter_crawl(seeds, extract, follow, match, depth, domains, workers,
+                                        maxpages, visited, agent):
+        for item in items:
+            item[SOURCE_URL_FIELD] = url
+            findata.append(item)
+    return findata
@@ -1,29 +1,306 @@
 # -*- coding: utf8 -*-
+import re
+import threading
+import lxml.etree
 from .consts import *
+from . import stats
 
-def table_to_dict(node, strip_lf=True):
-    """Extracts data from table"""
-    data = []
-    rows = node.xpath('./tbody/tr')
-    if len(rows) == 0:
-        rows = node.xpath('./tr')
+_local = threading.local()
+SIMPLE_XPATH_RE = re.compile(r'^//([A-Za-z][\w.-]*)(\[.*\])?$')
+# Predicates depending on element position or siblings, they could not be evaluated on element
+# detached from already processed siblings
+POSITIONAL_PREDICATE_RE = re.compile(r'^\[\s*\.?\d|\bposition\s*\(|\blast\s*\(|'
+                                     r'\bpreceding|\bfollowing')
+STRING_LITERAL_RE = re.compile(r'"[^"]*"|\'[^\']*\'')
+
+
+def compiled_xpath(expr):
+    """Returns compiled XPath object for expression. Compiled objects are cached per thread"""
+    cache = getattr(_local, 'xpaths', None)
+    if cache is None:
+        cache = _local.xpaths = {}
+    xpath = cache.get(expr)
+    if xpath is None:
+        if len(cache) >= DEFAULT_XPATH_CACHE_SIZE:
+            cache.clear()
+        xpath = cache[expr] = lxml.etree.XPath(expr)
+    return xpath
+
+
+def node_xpath(template, nodeclass=None, nodeid=None):
+    """Returns xpath of template like '//ul%s/li//a' with node class or id condition put into it.
+    Condition refers to $nodeclass or $nodeid XPath variable, so expression does not depend on their
+    values"""
+    if '%s' not in template:
+        return template
+    if nodeclass:
+        condition = "[@class=$nodeclass]"
+    elif nodeid:
+        condition = "[@id=$nodeid]"
+    else:
+        condition = ''
+    return template % (condition)
+
+
+def select_nodes(tree, template, nodeclass=None, nodeid=None):
+    """Selects nodes with xpath template like '//ul%s/li//a'. Node class or id condition is put into
+    template and their values are passed as XPath variables, so quotes in them do not break the
+    query"""
+    with stats.timer('xpath'):
+        expr = compiled_xpath(node_xpath(template, nodeclass, nodeid))
+        return expr(tree, nodeclass=nodeclass or '', nodeid=nodeid or '')
+
+
+def _single_predicate(predicate):
+    """Returns True if predicate string like "[...]" closes only at its end"""
+    depth = 0
+    quote = None
+    for i, ch in enumerate(predicate):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch == '[':
+            depth += 1
+        elif ch == ']':
+            depth -= 1
+            if depth == 0 and i != len(predicate) - 1:
+                return False
+    return depth == 0
+
+
+def stream_selector(xpath):
+    """Returns tag and match function to select elements of simple xpath like "//tag" or
+    "//tag[@attr='value']" while parsing document incrementally. Match is None if any element with
+    tag is selected. Predicates with position, last() or preceding and following axes are
+    rejected"""
+    m = SIMPLE_XPATH_RE.match(xpath.strip())
+    if m is None or (m.group(2) and not _single_predicate(m.group(2))):
+        raise ValueError('Only simple xpath like //tag or //tag[...] supported in streaming '
+                         'mode: %s' % (xpath))
+    tag, predicate = m.groups()
+    if predicate and POSITIONAL_PREDICATE_RE.search(STRING_LITERAL_RE.sub("''", predicate)):
+        raise ValueError('Position or sibling predicates are not supported in streaming mode: %s'
+                         % (xpath))
+    if not predicate:
+        return tag, None
+    expr = compiled_xpath('self::%s%s' % (tag, predicate))
+    return tag, lambda el: len(expr(el)) > 0
+
+
+def table_matcher(nodeclass=None, nodeid=None, sections=TABLE_SECTIONS):
+    """Returns match function for table rows while parsing document incrementally. Selects rows of
+    the first table with nodeclass or nodeid placed into sections or directly into table, rows of
+    nested tables are not selected"""
+    tables = []
+
+    def is_target(table):
+        if nodeclass:
+            return table.get('class') == nodeclass
+        elif nodeid:
+            return table.get('id') == nodeid
+        return True
+
+    def match(row):
+        parent = row.getparent().tag
+        if parent != 'table' and parent not in sections:
+            return False
+        if not tables:
+            candidates = [t for t in row.iterancestors('table') if is_target(t)]
+            if not candidates:
+                return False
+            tables.append(candidates[-1])
+        return next(row.iterancestors('table'), None) is tables[0]
+    return match
+
+
+def iter_table_rows(node, sections=TABLE_SECTIONS):
+    """Yields rows of table in document order: rows of sections (thead, tbody and tfoot by default)
+    and rows placed directly into table. Rows of nested tables are not yielded"""
+    for child in node:
+        if child.tag == 'tr':
+            yield child
+        elif child.tag in sections:
+            for row in child:
+                if row.tag == 'tr':
+                    yield row
+
+
+def _span(value):
+    """Returns colspan or rowspan attribute value as int"""
+    if value is None:
+        return 1
+    try:
+        span = int(value)
+    except (TypeError, ValueError):
+        return 1
+    return min(max(span, 1), MAX_TABLE_SPAN)
+
+
+def cell_value(cell, strip_lf=True):
+    """Returns text of table cell or, if cell has nested tables, list of their rows"""
+    if len(cell) == 0:
+        text = cell.text or ''
+    else:
+        inner_tables = [child for child in cell if child.tag == 'table']
+        if inner_tables:
+            return [table_to_dict(t, strip_lf) for t in inner_tables]
+        text = ' '.join(cell.itertext())
+    if strip_lf:
+        text = text.replace('\r',u' ').replace('\n', u' ').strip()
+    return text
+
+
+def is_header_row(row):
+    """Returns True if row is in thead or has only th cells"""
+    if row.getparent().tag == 'thead':
+        return True
+    cells = [cell.tag for cell in row if cell.tag in TABLE_CELLS]
+    return len(cells) > 0 and all(tag == 'th' for tag in cells)
+
+
+def _fill_spanned(cells, pending):
+    """Appends to cells values of cells spanned from previous rows"""
+    while len(cells) in pending:
+        col = len(cells)
+        rest, value = pending[col]
+        cells.append(value)
+        if rest > 1:
+            pending[col] = (rest - 1, value)
+        else:
+            del pending[col]
+
+
+def row_to_list(row, strip_lf=True, pending=None):
+    """Extracts cells values from table row. Cells with colspan repeated for each column. pending is
+    dict shared between rows of the same table, cells with rowspan are kept there for next rows"""
+    cells = []
+    for cell in row:
+        if cell.tag not in TABLE_CELLS:
+            continue
+        if pending:
+            _fill_spanned(cells, pending)
+        value = cell_value(cell, strip_lf)
+        colspan = _span(cell.get('colspan'))
+        rowspan = _span(cell.get('rowspan'))
+        if rowspan > 1 and pending is not None:
+            for col in range(len(cells), len(cells) + colspan):
+                pending[col] = (rowspan - 1, value)
+        cells.extend([value] * colspan)
+    if pending:
+        _fill_spanned(cells, pending)
+        for col in sorted(col for col in pending if col > len(cells)):
+            cells.extend([''] * (col - len(cells)))
+            _fill_spanned(cells, pending)
+    return cells
+
+
+def iter_table_grid(node, strip_lf=True, sections=DATA_SECTIONS):
+    """Yields rows of table as lists of cells values, colspan and rowspan expanded into grid.
+    Only data rows are yielded by default, rows of thead and tfoot are skipped"""
+    pending = {}
+    for row in iter_table_rows(node, sections):
+        yield row_to_list(row, strip_lf, pending)
+
+
+def header_names(header_rows, width=0):
+    """Returns unique column names from header rows values. Values of several header rows joined
+    with space"""
+    width = max([width] + [len(cells) for cells in header_rows])
+    names = []
+    for col in range(width):
+        parts = []
+        for cells in header_rows:
+            value = cells[col] if col < len(cells) and isinstance(cells[col], str) else ''
+            if value and (not parts or parts[-1] != value):
+                parts.append(value)
+        name = ' '.join(parts) or 'col%d' % (col + 1)
+        if name in names:
+            name = '%s_%d' % (name, col + 1)
+        names.append(name)
+    return names
+
+
+def rows_to_records(rows, strip_lf=True):
+    """Converts table rows elements into dicts keyed by column headers. Leading rows in thead or
+    with th cells only are headers. Columns without header named col1, col2..."""
+    pending = {}
+    header_rows = []
+    names = None
     for row in rows:
-        cells = []
-        for cell in row.xpath('(./td|./th)'):
-            inner_tables = cell.xpath('./table')
-            if len(inner_tables) < 1:
-                text = ' '.join(cell.itertext()) #cell.text_content()
-                if strip_lf:
-                    text = text.replace('\r',u' ').replace('\n', u' ').strip()
-                cells.append(text)
-            else:
-                cells.append([table_to_dict(node, strip_lf) for t in inner_tables])
-        data.append(cells)
-    return data
+        if names is None and is_header_row(row):
+            header_rows.append(row_to_list(row, strip_lf, pending))
+            continue
+        cells = row_to_list(row, strip_lf, pending)
+        if names is None or len(cells) > len(names):
+            names = header_names(header_rows, len(cells))
+        yield dict(zip(names, cells))
+
+
+def table_to_records(node, strip_lf=True):
+    """Extracts data from table as list of dicts keyed by column headers"""
+    return list(rows_to_records(iter_table_rows(node), strip_lf))
+
+
+def table_to_dict(node, strip_lf=True):
+    """Extracts data rows from table as list of rows, colspan and rowspan expanded. Rows of thead
+    and tfoot are skipped, use :func:`table_to_records` to get rows keyed by headers"""
+    return list(iter_table_grid(node, strip_lf))
+
+
+def find_next_link(root, nextxpath=None):
+    """Returns href of the next page link or None. Link is selected by nextxpath, element with href
+    or string result, or, if nextxpath not set, found as link or a tag with rel=next"""
+    results = compiled_xpath(nextxpath or NEXT_LINK_XPATH)(root.getroottree())
+    for result in results:
+        href = result.get('href') if hasattr(result, 'get') else str(result)
+        if href and href.strip():
+            return href.strip()
+    return None
+
+
+def table_ids(tables):
+    """Returns unique ids of tables: id attribute or table<N> with table number in list. Repeated
+    ids get number suffix"""
+    ids = []
+    for i, table in enumerate(tables):
+        tableid = table.get('id') or 'table%d' % (i)
+        if tableid in ids:
+            tableid = '%s_%d' % (tableid, i)
+        ids.append(tableid)
+    return ids
+
+
+def taglist_to_columns(tags, fields, strip_lf=True):
+    """Converts list of tags into dict of columns, field name as key and list of values of each tag
+    as value. Each field extracted in single pass over tags, without building dict per tag"""
+    with stats.timer('rows'):
+        return _taglist_columns(tags, fields, strip_lf)
+
+
+def _taglist_columns(tags, fields, strip_lf=True):
+    columns = {}
+    if TAG_FIELD in fields:
+        columns[TAG_FIELD] = [t.tag for t in tags]
+    if TEXT_FIELD in fields:
+        if strip_lf:
+            columns[TEXT_FIELD] = [' '.join(' '.join(t.itertext()).split()) for t in tags]
+        else:
+            columns[TEXT_FIELD] = [' '.join(t.itertext()).strip() for t in tags]
+    for f in fields:
+        if f not in columns:
+            columns[f] = [t.get(f, '').strip() for t in tags]
+    return columns
 
 
 def taglist_to_dict(tags, fields, strip_lf=True):
     """Converts list of tags into dict"""
+    with stats.timer('rows'):
+        return _taglist_dicts(tags, fields, strip_lf)
+
+
+def _taglist_dicts(tags, fields, strip_lf=True):
     has_text = TEXT_FIELD in fields
     has_tag = TAG_FIELD in fields
     finfields = fields.copy()
@@ -35,11 +312,10 @@ def taglist_to_dict(tags, fields, strip_lf=True):
         if has_tag:
             item[TAG_FIELD] = t.tag
         if has_text:
-            item[TEXT_FIELD] = ' '.join(t.itertext()).strip()
-            if strip_lf:
-                item[TEXT_FIELD] = (' '.join(item[TEXT_FIELD].split())).strip()
+            text = ' '.join(t.itertext())
+            item[TEXT_FIELD] = ' '.join(text.split()) if strip_lf else text.strip()
         for f in finfields:
-            item[f] = t.attrib[f].strip() if f in t.attrib.keys() else ""
+            value = t.get(f)
+            item[f] = value.strip() if value is not None else ""
         data.append(item)
     return data
-
@@ -0,0 +1,235 @@
+# -*- coding: utf8 -*-
+"""Jobs running several extractors against single fetch and parse of each page.
+
+Job is a dict (or YAML / JSON file) like::
+
+    url: http://example.com/list
+    pagekey: page
+    pagerange: 1,10,1,-1
+    workers: 4
+    extractors:
+      links:
+        type: xpath
+        xpath: //a
+        fieldnames: href,_text
+        absolutize: true
+        output: links.csv
+      options:
+        type: pattern
+        pattern: simpleopt
+      data:
+        type: table
+        nodeid: data
+        format: ndjson
+
+Instead of url it could have list of urls or localfile. With pagination each url is paged
+separately. Instead of pagekey job could have follow: true to follow rel=next links or follow: XPath
+of next link, and maxpages. Each extractor is written to its own output, by default to file named as
+extractor with format extension.
+"""
+import os
+import json
+import logging
+
+from .consts import *
+from .patterns import PATTERNS, pattern_xpaths
+from .htmltools import node_xpath
+from .procpool import get_parse_pool
+from .urltools import get_from_file
+from .scraper import page_url, extract_xpath_page, extract_pattern_page, extract_table_page, \
+    _page_numbers, _map_pages, _absolutize_page, _follow_pages, _extract_url
+from .writers import get_writer, is_binary, is_appendable
+from . import stats, metrics
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+def load_job(filename):
+    """Loads job from YAML or JSON file"""
+    with open(filename, 'r', encoding='utf8') as f:
+        if filename.lower().endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ImportError('PyYAML required to load YAML jobs')
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _xpath_extractor(spec):
+    fields = spec['fieldnames'].split(',') if spec.get('fieldnames') else DEFAULT_FIELDS
+
+    def extract(root, url):
+        items = extract_xpath_page(root, spec['xpath'], fields)
+        return _absolutize_page(items, url, fields, spec.get('absolutize', False))
+    return extract, fields, True
+
+
+def _pattern_extractor(spec):
+    pat = PATTERNS[spec['pattern']]
+    fields = spec['fieldnames'].split(',') if spec.get('fieldnames') else pat['deffields']
+
+    def extract(root, url):
+        items = extract_pattern_page(root, spec['pattern'], spec.get('nodeclass'),
+                                     spec.get('nodeid'), fields)
+        if isinstance(items, dict):
+            return [items]
+        return _absolutize_page(items, url, fields, spec.get('absolutize', False))
+    return extract, fields, True
+
+
+def _table_extractor(spec):
+    fields = spec['fieldnames'].split(',') if spec.get('fieldnames') else None
+    headers = spec.get('headers', False) or spec.get('headerrow', False)
+
+    def extract(root, url):
+        return extract_table_page(root, spec.get('nodeclass'), spec.get('nodeid'),
+                                  headers, spec.get('index', 0))
+    return extract, fields, headers
+
+
+EXTRACTORS = {
+'xpath' : _xpath_extractor,
+'pattern' : _pattern_extractor,
+'table' : _table_extractor,
+}
+
+
+def make_extractors(job):
+    """Returns list of (name, extract function, fields, dictrows) for job extractors. Extract
+    function gets parsed page and its url, url-like fields are absolutized against it"""
+    extractors = []
+    for name, spec in job['extractors'].items():
+        if spec.get('type') not in EXTRACTORS:
+            raise ValueError('Unknown extractor type %s of %s' % (spec.get('type'), name))
+        extract, fields, dictrows = EXTRACTORS[spec['type']](spec)
+        extractors.append((name, extract, fields, dictrows))
+    return extractors
+
+
+def _url_pages(job, url):
+    """Yields (url, postdata) of all pages of url. url is None for local file"""
+    pagekey = job.get('pagekey')
+    post = job.get('post', False)
+    if not pagekey or url is None:
+        yield url, {} if post and url is not None else None
+        return
+    start, end, step = map(int, job['pagerange'].split(',')[:3])
+    for current in _page_numbers(start, end, step):
+        yield page_url(url, pagekey, current), {pagekey : str(current)} if post else None
+
+
+def job_xpaths(job):
+    """Returns xpath expressions evaluated by job extractors, used to compile them in advance"""
+    xpaths = []
+    for spec in job['extractors'].values():
+        if spec.get('type') == 'xpath':
+            xpaths.append(spec['xpath'])
+        elif spec.get('type') == 'pattern':
+            xpaths.extend(pattern_xpaths(spec['pattern'], spec.get('nodeclass'),
+                                         spec.get('nodeid')))
+        elif spec.get('type') == 'table':
+            xpaths.append(node_xpath(TABLE_XPATH, spec.get('nodeclass'), spec.get('nodeid')))
+    return xpaths
+
+
+def extract_job_page(root, job, url):
+    """Returns dict with extractor name as key and list of items extracted from parsed page with
+    url as value. Used by parse pool workers, which get job instead of extractor functions"""
+    return {name: extract(root, url) for name, extract, fields, dictrows in make_extractors(job)}
+
+
+def iter_job(job, checkpoint=None):
+    """Runs all job extractors against each fetched and parsed page once. Yields dicts with
+    extractor name as key and list of extracted items as value, one dict per page. If pagerange has
+    pagesize, pagination stops when first extractor returns less than pagesize items
+
+    :param job:
+        Job dict, see :mod:`lazyscraper.jobs`
+    :type job: dict
+    :param checkpoint:
+        Checkpoint store of completed pages, pages done in previous run are not fetched again
+    :type checkpoint: :class:`lazyscraper.checkpoint.Checkpoint`
+
+    :return: Yields extracted values of each page
+    :rtype: :class:`dict`."""
+    extractors = make_extractors(job)
+    pagesize = -1
+    if job.get('pagekey') and len(job['pagerange'].split(',')) > 3:
+        pagesize = int(job['pagerange'].split(',')[3])
+
+    def extract_all(root, url):
+        return {name: extract(root, url) for name, extract, fields, dictrows in extractors}
+
+    def process_page(page):
+        url, postdata = page
+        if url is None:
+            return extract_all(get_from_file(job['localfile']), None)
+        logging.info('Processing url %s' % (url))
+        if get_parse_pool() is not None:
+            return _extract_url(url, extract_job_page, job, url, postdata=postdata)
+        return _extract_url(url, extract_all, url, postdata=postdata)
+
+    first = extractors[0][0]
+    for url in job.get('urls') or [job.get('url')]:
+        if job.get('follow') and url is not None:
+            pages = _follow_pages(url, extract_all, job['follow'], job.get('maxpages'))
+        else:
+            pages = _map_pages(process_page, _url_pages(job, url), job.get('workers', 1), pagesize,
+                               lambda results: len(results[first]), checkpoint, json.dumps)
+        for results in pages:
+            metrics.add_rows(sum(len(items) for items in results.values()))
+            yield results
+
+
+def _job_outputs(job):
+    """Returns dict of (filename, format) of job extractors outputs"""
+    outputs = {}
+    for name, spec in job['extractors'].items():
+        json_only = spec['type'] == 'pattern' and PATTERNS[spec['pattern']]['json_only']
+        format = spec.get('format', 'json' if json_only else 'csv')
+        outputs[name] = (spec.get('output') or '%s.%s' % (name, format), format)
+    return outputs
+
+
+def run_job(job, open_output=None, checkpoint=None):
+    """Runs job and writes results of each extractor to its own output. Returns dict with number of
+    items written per extractor. open_output(filename, format) is used to open outputs, files opened
+    by default. On resume from checkpoint outputs are appended if all of them are csv or ndjson
+    files, otherwise rewritten with items of completed pages from checkpoint"""
+    files = _job_outputs(job)
+    append = checkpoint is not None and checkpoint.resume and open_output is None and \
+        all(is_appendable(format) and os.path.exists(filename)
+            for filename, format in files.values())
+    if checkpoint is not None:
+        checkpoint.replay = not append
+    if open_output is None:
+        def open_output(filename, format):
+            if is_binary(format):
+                return open(filename, 'wb')
+            return open(filename, 'a' if append else 'w', encoding='utf8')
+    outputs = {}
+    writers = {}
+    counts = {}
+    try:
+        for name, extract, fields, dictrows in make_extractors(job):
+            spec = job['extractors'][name]
+            filename, format = files[name]
+            outputs[name] = open_output(filename, format)
+            if checkpoint is not None:
+                checkpoint.add_output(outputs[name])
+            writers[name] = get_writer(format, outputs[name], fields, dictrows,
+                                       spec.get('pretty', False), header=not append)
+            counts[name] = 0
+        for results in iter_job(job, checkpoint):
+            for name, items in results.items():
+                for item in items:
+                    writers[name].write(item)
+                counts[name] += len(items)
+                stats.incr('rows', len(items))
+        for writer in writers.values():
+            writer.close()
+    finally:
+        for io in outputs.values():
+            io.close()
+    return counts
@@ -0,0 +1,271 @@
+# -*- coding: utf8 -*-
+"""Prometheus metrics of fetching, parsing and extraction for long running processes. Metrics are
+collected only when set with :func:`set_metrics` and exposed in Prometheus text format by local HTTP
+endpoint (:func:`start_http_server`) or written to file for node_exporter textfile collector
+(:class:`TextfileWriter`)"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .consts import *
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    return '{%s}' % (','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs))
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Counter with labels"""
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, labels=(), value=1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, _labels(self.labels, labels), value
+
+
+class Gauge(Counter):
+    """Gauge with labels"""
+    kind = 'gauge'
+
+    def set(self, labels=(), value=0):
+        self.values[labels] = value
+
+
+class Histogram:
+    """Histogram with labels and fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = list(buckets) + [float('inf')]
+        self.values = {}
+
+    def observe(self, labels=(), value=0.0):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            for bound, bucket in zip(self.buckets, counts):
+                bucket_labels = _labels(self.labels, labels, [('le', _number(bound))])
+                yield self.name + '_bucket', bucket_labels, bucket
+            yield self.name + '_sum', _labels(self.labels, labels), total
+            yield self.name + '_count', _labels(self.labels, labels), count
+
+
+class Metrics:
+    """Registry of scraper metrics, updated from fetch functions and scraper loops"""
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.lock = threading.Lock()
+        self.in_flight = Gauge('lazyscraper_requests_in_flight', 'HTTP requests in flight')
+        self.fetch_duration = Histogram('lazyscraper_fetch_duration_seconds',
+                                        'HTTP request duration per host', ('host',), buckets)
+        self.responses = Counter('lazyscraper_responses_total',
+                                 'HTTP responses per host and status', ('host', 'status'))
+        self.errors = Counter('lazyscraper_errors_total',
+                              'Failed requests per host and status, 4xx, 5xx or exception name',
+                              ('host', 'status'))
+        self.downloaded = Counter('lazyscraper_downloaded_bytes_total', 'Bytes downloaded per host',
+                                  ('host',))
+        self.cache = Counter('lazyscraper_cache_requests_total',
+                             'Response cache lookups by result: hit, miss or revalidated',
+                             ('result',))
+        self.cache_ratio = Gauge('lazyscraper_cache_hit_ratio',
+                                 'Share of response cache lookups served from cache')
+        self.parse_duration = Histogram('lazyscraper_parse_duration_seconds', 'HTML parse duration',
+                                        (), buckets)
+        self.rows = Counter('lazyscraper_rows_total', 'Extracted rows')
+        self.all = [self.in_flight, self.fetch_duration, self.responses, self.errors,
+                    self.downloaded, self.cache, self.cache_ratio, self.parse_duration, self.rows]
+        self.in_flight.set((), 0)
+
+    def request_started(self, host):
+        with self.lock:
+            self.in_flight.inc((), 1)
+
+    def request_finished(self, host, status, seconds, nbytes=None):
+        """Records finished request. status is HTTP status code or exception name if request
+        failed"""
+        with self.lock:
+            self.in_flight.inc((), -1)
+            self.fetch_duration.observe((host,), seconds)
+            if isinstance(status, int):
+                self.responses.inc((host, str(status)))
+            if not isinstance(status, int) or status >= 400:
+                self.errors.inc((host, str(status)))
+            if nbytes:
+                self.downloaded.inc((host,), nbytes)
+
+    def add_downloaded(self, host, nbytes):
+        with self.lock:
+            self.downloaded.inc((host,), nbytes)
+
+    def cache_lookup(self, result):
+        with self.lock:
+            self.cache.inc((result,))
+
+    def parse_time(self, seconds):
+        with self.lock:
+            self.parse_duration.observe((), seconds)
+
+    def add_rows(self, count):
+        with self.lock:
+            self.rows.inc((), count)
+
+    def render(self):
+        """Returns metrics in Prometheus text exposition format"""
+        with self.lock:
+            served = self.cache.values.get(('hit',), 0) + self.cache.values.get(('revalidated',), 0)
+            total = served + self.cache.values.get(('miss',), 0)
+            self.cache_ratio.set((), served / total if total else 0.0)
+            lines = []
+            for metric in self.all:
+                lines.append('# HELP %s %s' % (metric.name, metric.help))
+                lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+                for name, labels, value in metric.samples():
+                    lines.append('%s%s %s' % (name, labels, _number(value)))
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = None
+
+
+def set_metrics(metrics):
+    """Sets metrics registry updated by fetch functions and scraper loops. None disables metrics"""
+    global _metrics
+    _metrics = metrics
+
+
+def get_metrics():
+    """Returns metrics registry or None"""
+    return _metrics
+
+
+def request_started(host):
+    if _metrics is not None:
+        _metrics.request_started(host)
+
+
+def request_finished(host, status, seconds, nbytes=None):
+    if _metrics is not None:
+        _metrics.request_finished(host, status, seconds, nbytes)
+
+
+def add_downloaded(host, nbytes):
+    if _metrics is not None:
+        _metrics.add_downloaded(host, nbytes)
+
+
+def cache_lookup(result):
+    if _metrics is not None:
+        _metrics.cache_lookup(result)
+
+
+def parse_time(seconds):
+    if _metrics is not None:
+        _metrics.parse_time(seconds)
+
+
+def add_rows(count):
+    if _metrics is not None:
+        _metrics.add_rows(count)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """HTTP server exposing metrics on /metrics"""
+    daemon_threads = True
+
+    def __init__(self, metrics, port=DEFAULT_METRICS_PORT, addr='127.0.0.1'):
+        super().__init__((addr, port), MetricsHandler)
+        self.metrics = metrics
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def start_http_server(port=DEFAULT_METRICS_PORT, addr='127.0.0.1', metrics=None):
+    """Starts serving metrics (shared registry by default) on http://addr:port/metrics in background
+    thread"""
+    server = MetricsServer(metrics or get_metrics(), port, addr)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_textfile(path, metrics=None):
+    """Writes metrics (shared registry by default) to file for node_exporter textfile collector,
+    atomically"""
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w', encoding='utf8') as f:
+        f.write((metrics or get_metrics()).render())
+    os.replace(tmp, path)
+
+
+class TextfileWriter:
+    """Writes metrics to file every interval seconds in background thread and once more on stop"""
+    def __init__(self, path, interval=DEFAULT_METRICS_INTERVAL, metrics=None):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics or get_metrics()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            write_textfile(self.path, self.metrics)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        write_textfile(self.path, self.metrics)
@@ -1,40 +1,28 @@
 # -*- coding: utf8 -*-
 from .consts import *
-from .htmltools import table_to_dict, taglist_to_dict
+from .htmltools import table_to_dict, taglist_to_dict, select_nodes, compiled_xpath, node_xpath
+
+SIMPLEUL_XPATH = '//ul%s/li//a'
+SIMPLEOPT_XPATH = '//select%s/option'
+EXTURLS_XPATH = '//a%s'
+FORMS_XPATH = '//form'
+FORM_OPTIONS_XPATH = 'option'
 
 def pattern_extract_simpleul(tree, nodeclass, nodeid, fields):
     """Simple UL lists extractor pattern"""
-    if nodeclass:
-        xfilter = "//ul[@class='%s']/li//a" % (nodeclass)
-    elif nodeid:
-        xfilter = "//ul[@id='%s']/li//a" % (nodeid)
-    else:
-        xfilter = '//ul/li//a'
-    tags = tree.xpath(xfilter)
+    tags = select_nodes(tree, SIMPLEUL_XPATH, nodeclass, nodeid)
     data = taglist_to_dict(tags, fields)
     return data
 
 def pattern_extract_simpleoptions(tree, nodeclass, nodeid, fields):
     """Simple SELECT / OPTION  extractor pattern"""
-    if nodeclass:
-        xfilter = "//select[@class='%s']/option" % (nodeclass)
-    elif nodeid:
-        xfilter = "//select[@id='%s']/option" % (nodeid)
-    else:
-        xfilter = '//select/option'
-    tags = tree.xpath(xfilter)
+    tags = select_nodes(tree, SIMPLEOPT_XPATH, nodeclass, nodeid)
     data = taglist_to_dict(tags, fields)
     return data
 
 def pattern_extract_exturls(tree, nodeclass, nodeid, fields):
     """Pattern to extract external urls"""
-    if nodeclass:
-        xfilter = "//a[@class='%s']" % (nodeclass)
-    elif nodeid:
-        xfilter = "//a[@id='%s']" % (nodeid)
-    else:
-        xfilter = '//a'
-    tags = tree.xpath(xfilter)
+    tags = select_nodes(tree, EXTURLS_XPATH, nodeclass, nodeid)
     filtered = []
     for t in tags:
         if 'href' in t.attrib.keys():
@@ -52,8 +40,9 @@ def pattern_extract_forms(tree, nodeclass, nodeid, fields):
     buttonlist = ['name', 'id', 'value', 'class']
     selectlist = ['name', 'id', 'multiple', 'size', 'class']
     optionlist = ['value', 'selected', 'class']
-    tagnames = [('input', inputattrlist), ('textarea', textarealist), ('button', buttonlist), ('select', selectlist)]
-    allforms = tree.xpath('//form')
+    tagnames = [('input', inputattrlist), ('textarea', textarealist), ('button', buttonlist),
+                ('select', selectlist)]
+    allforms = compiled_xpath(FORMS_XPATH)(tree)
     for form in allforms:
         fkey = {}
         for k in formattrlist:
@@ -70,7 +59,7 @@ def pattern_extract_forms(tree, nodeclass, nodeid, fields):
                             tval[k] = tag.attrib[k]
                     if tag.tag == 'select':
                         tval['options'] = []
-                        options = tag.xpath('option')
+                        options = compiled_xpath(FORM_OPTIONS_XPATH)(tag)
                         for o in options:
                             optionval = {'text' : o.text}
                             for k in optionlist:
@@ -82,8 +71,17 @@ def pattern_extract_forms(tree, nodeclass, nodeid, fields):
     return {'total' : len(res), 'list' : res}
 
 PATTERNS = {
-'simpleul' : {'func' : pattern_extract_simpleul, 'deffields' : DEFAULT_URL_FIELDS, 'json_only' : False },
-'simpleopt' : {'func' : pattern_extract_simpleoptions, 'deffields' : DEFAULT_SELECT_FIELDS , 'json_only' : False },
-'exturls' : {'func' : pattern_extract_exturls, 'deffields' : DEFAULT_URL_FIELDS, 'json_only' : False },
-'getforms' : {'func' : pattern_extract_forms, 'deffields' : None, 'json_only' : True },
+'simpleul' : {'func' : pattern_extract_simpleul, 'deffields' : DEFAULT_URL_FIELDS,
+              'json_only' : False, 'xpaths' : [SIMPLEUL_XPATH]},
+'simpleopt' : {'func' : pattern_extract_simpleoptions, 'deffields' : DEFAULT_SELECT_FIELDS,
+               'json_only' : False, 'xpaths' : [SIMPLEOPT_XPATH]},
+'exturls' : {'func' : pattern_extract_exturls, 'deffields' : DEFAULT_URL_FIELDS,
+             'json_only' : False, 'xpaths' : [EXTURLS_XPATH]},
+'getforms' : {'func' : pattern_extract_forms, 'deffields' : None, 'json_only' : True,
+              'xpaths' : [FORMS_XPATH, FORM_OPTIONS_XPATH]},
 }
+
+
+def pattern_xpaths(pattern, nodeclass=None, nodeid=None):
+    """Returns xpath expressions evaluated by pattern, used to compile them in advance"""
+    return [node_xpath(template, nodeclass, nodeid) for template in PATTERNS[pattern]['xpaths']]
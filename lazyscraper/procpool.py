@@ -0,0 +1,56 @@
+# -*- coding: utf8 -*-
+"""Process pool parsing fetched pages and extracting items in worker processes, so parsing is not
+limited by GIL to single core. Pages are fetched in main process, only page bytes are sent to
+workers and only extracted items are sent back"""
+import multiprocessing
+from .consts import *
+from .htmltools import compiled_xpath
+from .urltools import parse_html
+from . import stats
+
+
+def _init_worker(xpaths):
+    """Warms up worker, xpaths are compiled once per worker"""
+    for xpath in xpaths:
+        compiled_xpath(xpath)
+
+
+def _extract(content, func, args):
+    return func(parse_html(content), *args)
+
+
+class ParsePool:
+    """Pool of long lived worker processes. Each worker is replaced after max_tasks pages to bound
+    its memory"""
+    def __init__(self, processes=None, max_tasks=DEFAULT_MAX_TASKS_PER_CHILD, xpaths=None):
+        self.pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                         initargs=(list(xpaths or []),), maxtasksperchild=max_tasks)
+
+    def extract(self, content, func, *args):
+        """Parses content in worker process and returns func(root, *args). func should be module
+        level function"""
+        with stats.timer('parse.pool'):
+            return self.pool.apply(_extract, (content, func, args))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+_pool = None
+
+
+def set_parse_pool(pool):
+    """Sets process pool used by scraper functions to parse pages. None parses pages in current
+    process"""
+    global _pool
+    _pool = pool
+
+
+def get_parse_pool():
+    """Returns process pool used by scraper functions to parse pages or None"""
+    return _pool
@@ -0,0 +1,117 @@
+# -*- coding: utf8 -*-
+"""Per host rate limiter used by fetch functions"""
+import time
+import threading
+import email.utils
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from .consts import *
+
+
+def parse_retry_after(value):
+    """Returns seconds to wait from Retry-After header value, seconds or HTTP date. None if not
+    parsed"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        dt = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(dt.timestamp() - time.time(), 0.0)
+
+
+class HostState:
+    """Token bucket and backoff state of single host"""
+    def __init__(self, burst, max_concurrent):
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.backoff = 0.0
+        self.semaphore = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+
+class RateLimiter:
+    """Token bucket rate limiter with rate requests per second and up to max_concurrent connections
+    per host. Hosts answering 429 or 503 are paused for Retry-After seconds or for backoff that
+    doubles on every throttled response and resets after successful one"""
+    def __init__(self, rate=None, burst=1, max_concurrent=None, backoff=DEFAULT_LIMIT_BACKOFF,
+                 max_backoff=DEFAULT_LIMIT_MAX_BACKOFF, retries=DEFAULT_LIMIT_RETRIES):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.initial_backoff = backoff
+        self.max_backoff = max_backoff
+        self.retries = retries
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.burst, self.max_concurrent)
+        return state
+
+    def reserve(self, url):
+        """Reserves request slot for url host. Returns seconds to wait before sending request"""
+        host = urlsplit(url).netloc
+        with self.lock:
+            state = self._state(host)
+            now = time.monotonic()
+            delay = max(state.blocked_until - now, 0.0)
+            if self.rate:
+                state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+                state.updated = now
+                state.tokens -= 1
+                if state.tokens < 0:
+                    delay = max(delay, -state.tokens / self.rate)
+            return delay
+
+    @contextmanager
+    def slot(self, url):
+        """Waits for rate limit and concurrent connections limit of url host"""
+        with self.lock:
+            semaphore = self._state(urlsplit(url).netloc).semaphore
+        if semaphore is not None:
+            semaphore.acquire()
+        try:
+            delay = self.reserve(url)
+            if delay > 0:
+                time.sleep(delay)
+            yield
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    def feedback(self, url, status, retry_after=None):
+        """Updates host backoff from response status. Returns True if host throttled request and it
+        should be retried"""
+        host = urlsplit(url).netloc
+        with self.lock:
+            state = self._state(host)
+            if status not in THROTTLE_STATUSES:
+                state.backoff = 0.0
+                return False
+            state.backoff = min(state.backoff * 2 if state.backoff else self.initial_backoff,
+                                self.max_backoff)
+            wait = parse_retry_after(retry_after)
+            if wait is None:
+                wait = state.backoff
+            state.blocked_until = max(state.blocked_until, time.monotonic() + wait)
+            return True
+
+
+_limiter = None
+
+
+def set_rate_limiter(limiter):
+    """Sets rate limiter used by fetch functions. None disables rate limiting"""
+    global _limiter
+    _limiter = limiter
+
+
+def get_rate_limiter():
+    """Returns rate limiter used by fetch functions or None"""
+    return _limiter
@@ -2,19 +2,313 @@
 # -*- coding: utf8 -*-
 
 import logging
-from urllib.parse import urljoin
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode, urldefrag
 
 from .consts import *
-from .htmltools import taglist_to_dict, table_to_dict
-from .urltools import get_cached_url, get_cached_post, get_from_file
+from .htmltools import taglist_to_dict, taglist_to_columns, table_to_dict, select_nodes, \
+    compiled_xpath, stream_selector, table_matcher, row_to_list, table_to_records, \
+    rows_to_records, table_ids, find_next_link
+from .urltools import get_cached_url, get_cached_post, get_from_file, iter_elements, fetch_url
+from .procpool import get_parse_pool
+from . import stats, metrics
 from .patterns import  PATTERNS
 
 #logging.getLogger().addHandler(logging.StreamHandler())
 logging.basicConfig(
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         level=logging.DEBUG)
- 
-def extract_data_xpath(url, filename=None, xpath=None, fieldnames=None, absolutize=False, post=None, pagekey=None, pagerange=None):
+
+
+def _page_numbers(start, end, step):
+    """Yields page numbers from start to end (inclusive). If end is -1 yields pages infinitely"""
+    current = start
+    while end == -1 or current <= end:
+        yield current
+        current += step
+
+
+def _parse_pagerange(pagerange):
+    """Returns start, end, step and pagesize from pagerange string 'start,end,step[,pagesize]'"""
+    values = list(map(int, pagerange.split(',')))
+    if len(values) == 3:
+        values.append(-1)
+    return values[:4]
+
+
+def _map_pages(func, pages, workers=1, pagesize=-1, size=len, checkpoint=None, key=str):
+    """Applies func to every page and yields results in page order. If workers > 1 pages processed
+    in parallel threads, but no more than workers pages scheduled ahead. If pagesize is not -1 stops
+    after first page with less than pagesize items, counted by size(result). If checkpoint is set,
+    pages with key(page) completed before are not processed again and every new page is saved to
+    checkpoint after its result is consumed"""
+    if checkpoint is not None:
+        yield from _map_checkpointed_pages(func, pages, workers, pagesize, size, checkpoint, key)
+        return
+    pages = iter(pages)
+    if workers is None or workers < 2:
+        for page in pages:
+            items = func(page)
+            yield items
+            if pagesize != -1 and size(items) < pagesize:
+                logging.info('Breaking loop. %d vs %d' % (size(items), pagesize))
+                break
+        return
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for page in pages:
+            pending.append(executor.submit(func, page))
+            if len(pending) == workers:
+                break
+        while pending:
+            items = pending.popleft().result()
+            yield items
+            if pagesize != -1 and size(items) < pagesize:
+                logging.info('Breaking loop. %d vs %d' % (size(items), pagesize))
+                break
+            for page in pages:
+                pending.append(executor.submit(func, page))
+                break
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _map_checkpointed_pages(func, pages, workers, pagesize, size, checkpoint, key):
+    def process_page(page):
+        items = checkpoint.get(key(page))
+        if items is not None:
+            return page, True, items
+        return page, False, func(page)
+
+    for page, done, items in _map_pages(process_page, pages, workers, pagesize,
+                                        lambda result: size(result[2])):
+        if done:
+            if checkpoint.replay:
+                yield items
+            continue
+        yield items
+        checkpoint.save(key(page), items)
+
+
+def _extract_url(url, func, *args, postdata=None, agent=None):
+    """Fetches url and returns func(root, *args) for parsed page. If parse pool is set, page is
+    parsed and extracted in worker process"""
+    kwargs = {'agent' : agent} if agent else {}
+    stats.incr('pages')
+    pool = get_parse_pool()
+    if pool is not None:
+        return pool.extract(fetch_url(url, postdata, **kwargs), func, *args)
+    if postdata is not None:
+        return func(get_cached_post(url, postdata, **kwargs), *args)
+    return func(get_cached_url(url, **kwargs), *args)
+
+
+def page_url(url, pagekey, page):
+    """Returns url of page with number page passed as pagekey parameter. Other query parameters of
+    url are kept"""
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key != pagekey]
+    query.append((pagekey, str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _follow_pages(url, extract, follow=True, maxpages=None, agent=None):
+    """Yields extract(root, anurl) for url and each next page found by following next links until
+    page without next link, already visited url or maxpages pages. follow is XPath of next link or
+    True to find link with rel=next. Next page is fetched and parsed in background while current
+    page is extracted"""
+    nextxpath = follow if isinstance(follow, str) else None
+    kwargs = {'agent' : agent} if agent else {}
+    visited = set()
+    executor = ThreadPoolExecutor(max_workers=1)
+    anurl = urldefrag(url)[0]
+    visited.add(anurl)
+    future = executor.submit(get_cached_url, anurl, **kwargs)
+    try:
+        while future is not None:
+            logging.info('Processing url %s' % (anurl))
+            root = future.result()
+            future = None
+            href = find_next_link(root, nextxpath)
+            if href is not None and (not maxpages or len(visited) < maxpages):
+                nexturl = urldefrag(urljoin(anurl, href))[0]
+                if nexturl not in visited:
+                    visited.add(nexturl)
+                    future = executor.submit(get_cached_url, nexturl, **kwargs)
+            yield extract(root, anurl)
+            if future is not None:
+                anurl = nexturl
+    finally:
+        if future is not None:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def extract_xpath_page(root, xpath, fields, columnar=False):
+    """Returns list of dicts with fields extracted from parsed page nodes selected by xpath.
+    If columnar is True returns dict of columns, field name as key and list of values as value"""
+    with stats.timer('xpath'):
+        tags = compiled_xpath(xpath)(root.getroottree())
+    if columnar:
+        return taglist_to_columns(tags, fields)
+    return taglist_to_dict(tags, fields)
+
+
+def extract_pattern_page(root, pattern, nodeclass, nodeid, fields):
+    """Returns data extracted from parsed page with pattern"""
+    return PATTERNS[pattern]['func'](root.getroottree(), nodeclass, nodeid, fields)
+
+
+def _table_rows(node, headers=False):
+    with stats.timer('rows'):
+        if headers:
+            return table_to_records(node, strip_lf=True)
+        return table_to_dict(node, strip_lf=True)
+
+
+def extract_table_page(root, nodeclass=None, nodeid=None, headers=False, index=0):
+    """Returns rows of the table with nodeclass or nodeid on parsed page, the first one or index-th
+    in document order. If headers is True, rows are dicts keyed by table column headers"""
+    tags = select_nodes(root.getroottree(), TABLE_XPATH, nodeclass, nodeid)
+    if len(tags) > index:
+        return _table_rows(tags[index], headers)
+    return []
+
+
+def extract_tables_page(root, nodeclass=None, nodeid=None, headers=False):
+    """Returns list of (table id, rows) of all tables with nodeclass or nodeid on parsed page.
+    Tables are selected in single walk of the tree"""
+    tags = select_nodes(root.getroottree(), TABLE_XPATH, nodeclass, nodeid)
+    return [(tableid, _table_rows(node, headers)) for tableid, node in zip(table_ids(tags), tags)]
+
+
+def _absolutize_func(url, fields, absolutize):
+    """Returns function that absolutizes url-like fields of item or None if nothing to absolutize"""
+    if not absolutize or fields is None:
+        return None
+    tagtypes = [tagtype for tagtype in URL_TAG_TYPES if tagtype in fields]
+    if len(tagtypes) == 0:
+        return None
+
+    def absolutize_item(item):
+        for tagtype in tagtypes:
+            if tagtype not in item.keys(): continue
+            if item[tagtype][:6] not in ['http:/', 'https:'] and len(item[tagtype]) > 0:
+                item[tagtype] = urljoin(url, item[tagtype])
+        return item
+    return absolutize_item
+
+
+def _absolutize_page(items, url, fields, absolutize, columnar=False):
+    """Absolutizes url-like fields of items extracted from page with url, list of dicts or dict of
+    columns if columnar is True. Single object results, like of 'getforms' pattern, kept as is"""
+    if not absolutize or fields is None:
+        return items
+    if columnar:
+        for tagtype in URL_TAG_TYPES:
+            if tagtype in items:
+                items[tagtype] = [value if value[:6] in ['http:/', 'https:'] or len(value) == 0
+                                  else urljoin(url, value) for value in items[tagtype]]
+        return items
+    fix = _absolutize_func(url, fields, absolutize)
+    if fix is None or isinstance(items, dict):
+        return items
+    return [fix(item) for item in items]
+
+
+def _column_size(columns):
+    """Returns number of rows in dict of columns"""
+    return len(next(iter(columns.values()))) if columns else 0
+
+
+def _iter_xpath_pages(url, filename, xpath, fields, post, pagekey, pagerange, workers, stream,
+                      columnar=False, follow=None, maxpages=None, checkpoint=None,
+                      absolutize=False):
+    """Yields data extracted with xpath from each page, list of dicts or dict of columns if columnar
+    is True. If absolutize is True url-like fields are absolutized against url of each page"""
+    size = _column_size if columnar else len
+    if follow and url is not None:
+        return _follow_pages(url, lambda root, anurl: _absolutize_page(
+            extract_xpath_page(root, xpath, fields, columnar), anurl, fields, absolutize, columnar),
+            follow, maxpages)
+    if stream and not pagekey:
+        tag, match = stream_selector(xpath)
+        elements = iter_elements(url, filename, tag, match,
+                                 postdata={} if post and url is not None else None)
+        convert = taglist_to_columns if columnar else taglist_to_dict
+        return (_absolutize_page(convert([el], fields), url, fields, absolutize, columnar)
+                for el in elements)
+    elif not pagekey:
+        if url is not None:
+            items = _extract_url(url, extract_xpath_page, xpath, fields, columnar,
+                                 postdata={} if post else None)
+        else:
+            items = extract_xpath_page(get_from_file(filename), xpath, fields, columnar)
+        return [_absolutize_page(items, url, fields, absolutize, columnar)]
+    start, end, step, pagesize = _parse_pagerange(pagerange)
+
+    def process_page(current):
+        anurl = page_url(url, pagekey, current)
+        logging.info('Processing url %s' % (anurl))
+        items = _extract_url(anurl, extract_xpath_page, xpath, fields, columnar,
+                             postdata={pagekey : str(current)} if post else None)
+        return _absolutize_page(items, anurl, fields, absolutize, columnar)
+
+    return _map_pages(process_page, _page_numbers(start, end, step), workers, pagesize, size,
+                      checkpoint,
+                      lambda current: ('POST ' if post else '') + page_url(url, pagekey, current))
+
+
+def iter_extract_data_xpath(url, filename=None, xpath=None, fieldnames=None, absolutize=False,
+                            post=None, pagekey=None, pagerange=None, workers=1, stream=False,
+                            follow=None, maxpages=None, checkpoint=None):
+    """Extract data with xpath. Generator version of :func:`extract_data_xpath`, yields items as
+    each page is parsed. If stream is True, page is parsed incrementally and items are yielded as
+    matching elements are completed, supported only for simple xpath like "//tag[@attr='value']" and
+    pages without pagination. If follow is set, pages are found by following next links instead of
+    pagekey, see :func:`extract_data_xpath`
+
+    :return: Yields extracted values
+    :rtype: :class:`dict`."""
+    fields = fieldnames.split(',') if fieldnames else DEFAULT_FIELDS
+    for items in _iter_xpath_pages(url, filename, xpath, fields, post, pagekey, pagerange, workers,
+                                   stream, False, follow, maxpages, checkpoint, absolutize):
+        metrics.add_rows(len(items))
+        yield from items
+
+
+def extract_columns_xpath(url, filename=None, xpath=None, fieldnames=None, absolutize=False,
+                          post=None, pagekey=None, pagerange=None, workers=1, stream=False,
+                          follow=None, maxpages=None, checkpoint=None):
+    """Extract data with xpath as columns. Same as :func:`extract_data_xpath`, but returns dict with
+    field name as key and list of values as value, ready for pandas.DataFrame or pyarrow.table,
+    without building dict per row
+
+    :return: Returns dict of extracted columns
+    :rtype: :class:`dict`."""
+    fields = fieldnames.split(',') if fieldnames else DEFAULT_FIELDS
+    columns = None
+    for page in _iter_xpath_pages(url, filename, xpath, fields, post, pagekey, pagerange, workers,
+                                  stream, True, follow, maxpages, checkpoint, absolutize):
+        metrics.add_rows(max([len(values) for values in page.values()] or [0]))
+        if columns is None:
+            columns = page
+        else:
+            for key, values in page.items():
+                columns[key].extend(values)
+    if columns is None:
+        columns = {key: [] for key in taglist_to_columns([], fields)}
+    return columns
+
+
+def extract_data_xpath(url, filename=None, xpath=None, fieldnames=None, absolutize=False, post=None,
+                       pagekey=None, pagerange=None, workers=1, stream=False, follow=None,
+                       maxpages=None, checkpoint=None):
     """Extract data with xpath
 
     :param url:
@@ -39,65 +333,73 @@ def extract_data_xpath(url, filename=None, xpath=None, fieldnames=None, absoluti
         Key of the page listing. GET or POST parameter
     :type pagekey: str|unicode
     :param pagerange:
-        Range of pages to process. String with format 'min,max,step', example: '1,72,1'
+        Range of pages to process. String with format 'min,max,step,pagesize', example: '1,72,1,-1'
     :type pagerange: str|unicode
+    :param workers:
+        Number of pages fetched in parallel
+    :type workers: int
+    :param stream:
+        Parse page incrementally, only for simple xpath like "//tag[@attr='value']"
+    :type stream: bool
+    :param follow:
+        Follow next page links: XPath of next link or True to find link with rel=next. Next page is
+        fetched while current one is extracted, stops on page without next link or already visited
+    :type follow: str|unicode|bool
+    :param maxpages:
+        Max number of pages to follow
+    :type maxpages: int
+    :param checkpoint:
+        Checkpoint store of completed pages, pages done in previous run are not fetched again
+    :type checkpoint: :class:`lazyscraper.checkpoint.Checkpoint`
 
 
     :return: Returns array of extracted values
     :rtype: :class:`array`."""
+    return list(iter_extract_data_xpath(url, filename, xpath, fieldnames, absolutize, post, pagekey,
+                                        pagerange, workers, stream, follow, maxpages, checkpoint))
 
 
-    fields = fieldnames.split(',') if fieldnames else DEFAULT_FIELDS
-    data = []
-    if pagekey is None:
-        if url is not None:
-            if post:
-                root = get_cached_post(url)
-            else:
-                root = get_cached_url(url)
-        else:
-            root =  get_from_file(filename      )
-        tree = root.getroottree()
-        tags = tree.xpath(xpath)
-        data = taglist_to_dict(tags, fields)
-    else:
-        start, end, step, pagesize = map(int, pagerange.split(','))
-#        for i in range(start, end, step):
-        current = start
-        while True:
-            anurl = url + '?%s=%d' % (pagekey,current)
-            logging.info('Processing url %s' % (anurl))
-            if post:
-                root = get_cached_post(anurl, {pagekey : str(current)})
-            else:
-                root = get_cached_url(anurl)
-            tree = root.getroottree()
-            tags = tree.xpath(xpath)
-#            print(tags)
-            items = taglist_to_dict(tags, fields)
-            data.extend(items)
-            current += 1
-            if pagesize != -1 and len(items) < pagesize:
-                logging.info('Breaking loop. %d vs %d' % (len(items), pagesize))
-                break
-            if end != -1 and current == end+1:
-                logging.info('Breaking loop. %d vs %d' % (len(items), pagesize))
-                break
+def iter_use_pattern(url, pattern, nodeid=None, nodeclass=None, fieldnames=None, absolutize=False,
+                     pagekey=False, pagerange=False, workers=1, follow=None, maxpages=None,
+                     checkpoint=None):
+    """Uses predefined pattern to extract page data. Generator version of :func:`use_pattern`,
+    yields items as each page is parsed. Patterns returning single object per page (like 'getforms')
+    yield it as one item
+
+    :return: Yields extracted values
+    :rtype: :class:`dict`."""
+    pat = PATTERNS[pattern]
+    fields = fieldnames.split(',') if fieldnames else pat['deffields']
 
-    has_urltagtype = False
-    for tagtype in URL_TAG_TYPES:
-        if tagtype in fields:
-            has_urltagtype = True
-    if absolutize and has_urltagtype:
-        for i in range(0, len(data)):
-            for tagtype in URL_TAG_TYPES:
-                if tagtype not in data[i].keys(): continue
-                if data[i][tagtype][:6] not in ['http:/', 'https:'] and len(data[i][tagtype]) > 0:
-                    data[i][tagtype] = urljoin(url, data[i][tagtype])
-    return data
+    def process_page(anurl):
+        logging.info('Processing url %s' % (anurl))
+        items = _extract_url(anurl, extract_pattern_page, pattern, nodeclass, nodeid, fields)
+        return _absolutize_page(items, anurl, fields, absolutize)
 
+    def extract_followed(root, anurl):
+        items = extract_pattern_page(root, pattern, nodeclass, nodeid, fields)
+        return _absolutize_page(items, anurl, fields, absolutize)
+
+    if follow:
+        pages = _follow_pages(url, extract_followed, follow, maxpages)
+    elif not pagekey:
+        pages = [process_page(url)]
+    else:
+        start, end, step = map(int, pagerange.split(','))
+        pageurls = (page_url(url, pagekey, i) for i in range(start, end, step))
+        pages = _map_pages(process_page, pageurls, workers, checkpoint=checkpoint)
+    for items in pages:
+        if isinstance(items, dict):
+            metrics.add_rows(1)
+            yield items
+            continue
+        metrics.add_rows(len(items))
+        yield from items
 
-def use_pattern(url, pattern, nodeid=None, nodeclass=None, fieldnames=None, absolutize=False, pagekey=False, pagerange=False):
+
+def use_pattern(url, pattern, nodeid=None, nodeclass=None, fieldnames=None, absolutize=False,
+                pagekey=False, pagerange=False, workers=1, follow=None, maxpages=None,
+                checkpoint=None):
     """Uses predefined pattern to extract page data
     :param url:
         HTML webpage url
@@ -120,41 +422,116 @@ def use_pattern(url, pattern, nodeid=None, nodeclass=None, fieldnames=None, abso
     :param pagerange:
         Range of pages to process. String with format 'min,max,step', example: '1,72,1'
     :type pagerange: str|unicode
+    :param workers:
+        Number of pages fetched in parallel
+    :type workers: int
+    :param follow:
+        Follow next page links: XPath of next link or True to find link with rel=next. Next page is
+        fetched while current one is extracted, stops on page without next link or already visited
+    :type follow: str|unicode|bool
+    :param maxpages:
+        Max number of pages to follow
+    :type maxpages: int
+    :param checkpoint:
+        Checkpoint store of completed pages, pages done in previous run are not fetched again
+    :type checkpoint: :class:`lazyscraper.checkpoint.Checkpoint`
 
     :return: Returns array of extracted values
     :rtype: :class:`array`."""
-    findata = []
-    pat = PATTERNS[pattern]
-    fields = fieldnames.split(',') if fieldnames else pat['deffields']
+    findata = list(iter_use_pattern(url, pattern, nodeid, nodeclass, fieldnames, absolutize,
+                                    pagekey, pagerange, workers, follow, maxpages, checkpoint))
+    if PATTERNS[pattern]['json_only'] and not pagekey and not follow:
+        return findata[0]
+    return findata
+
+
+def iter_get_table(url, nodeid=None, nodeclass=None, pagekey=False, pagerange=False, agent=None,
+                   workers=1, filename=None, stream=False, headers=False, index=0, follow=None,
+                   maxpages=None, checkpoint=None):
+    """Extracts table with data from html. Generator version of :func:`get_table`, yields rows as
+    each page is parsed. If stream is True, page is parsed incrementally and rows are yielded as
+    they are completed
 
-    if pagekey is False:
-        root = get_cached_url(url)
-        tree = root.getroottree()
-        findata = PATTERNS[pattern]['func'](tree, nodeclass, nodeid, fields)
+    :return: Yields table rows
+    :rtype: :class:`list`|:class:`dict`."""
+    if stream and index:
+        raise ValueError('Only the first table could be extracted in stream mode')
+    if stream and not pagekey:
+        matcher = table_matcher(nodeclass, nodeid, TABLE_SECTIONS if headers else DATA_SECTIONS)
+        rows = iter_elements(url, filename, 'tr', matcher, agent=agent)
+        if headers:
+            for record in rows_to_records(rows, strip_lf=True):
+                metrics.add_rows(1)
+                yield record
+        else:
+            pending = {}
+            for row in rows:
+                metrics.add_rows(1)
+                yield row_to_list(row, strip_lf=True, pending=pending)
+        return
+
+    def process_page(anurl):
+        if anurl is None:
+            return extract_table_page(get_from_file(filename), nodeclass, nodeid, headers, index)
+        logging.info('Crawling url %s' % (anurl))
+        return _extract_url(anurl, extract_table_page, nodeclass, nodeid, headers, index,
+                            agent=agent)
+
+    if follow and url is not None:
+        pages = _follow_pages(url, lambda root, anurl: extract_table_page(root, nodeclass, nodeid,
+                                                                          headers, index),
+                              follow, maxpages, agent)
+    elif not pagekey:
+        pages = [process_page(url)]
     else:
-        start, end, step = map(int, pagerange.split(','))
-        for i in range(start, end, step):
-            anurl = url + '?%s=%d' % (pagekey,i)
-#            print('Processing url %s' % (anurl))
-            root = get_cached_url(url)
-            tree = root.getroottree()
-            findata.extend(PATTERNS[pattern]['func'](tree, nodeclass, nodeid, fields))
-
-    has_urltagtype = False
-    if fields is not None:
-        for tagtype in URL_TAG_TYPES:
-            if tagtype in fields:
-                has_urltagtype = True
-    if absolutize and has_urltagtype:
-        for i in range(0, len(findata)):
-            for tagtype in URL_TAG_TYPES:
-                if tagtype not in findata[i].keys(): continue
-                if findata[i][tagtype][:6] not in ['http:/', 'https:'] and len(findata[i][tagtype]) > 0:
-                    findata[i][tagtype] = urljoin(url, findata[i][tagtype])
-    return findata
+        start, end, step, pagesize = _parse_pagerange(pagerange)
+        pageurls = (page_url(url, pagekey, i) for i in _page_numbers(start, end, step))
+        pages = _map_pages(process_page, pageurls, workers, pagesize, checkpoint=checkpoint)
+    for items in pages:
+        metrics.add_rows(len(items))
+        for item in items:
+            yield item
+
 
+def iter_get_tables(url, nodeid=None, nodeclass=None, pagekey=False, pagerange=False, agent=None,
+                    workers=1, filename=None, headers=False, follow=None, maxpages=None,
+                    checkpoint=None):
+    """Extracts all tables with nodeid or nodeclass (all tables if not set) from html, each page
+    fetched and parsed once. Table id is its id attribute or table<N> with N number of table on
+    page. With pagination up to workers pages are fetched in parallel. Tables of a page are
+    converted one by one, conversion is CPU bound and threads do not speed it up, use parse pool to
+    convert pages in several processes
 
-def get_table(url, nodeid=None, nodeclass=None, pagekey=False, pagerange=False, agent=None):
+    :return: Yields (table id, row) tuples
+    :rtype: :class:`tuple`."""
+    def process_page(anurl):
+        if anurl is None:
+            return extract_tables_page(get_from_file(filename), nodeclass, nodeid, headers)
+        logging.info('Crawling url %s' % (anurl))
+        return _extract_url(anurl, extract_tables_page, nodeclass, nodeid, headers, agent=agent)
+
+    if follow and url is not None:
+        pages = _follow_pages(url, lambda root, anurl: extract_tables_page(root, nodeclass, nodeid,
+                                                                           headers),
+                              follow, maxpages, agent)
+    elif not pagekey:
+        pages = [process_page(url)]
+    else:
+        start, end, step, pagesize = _parse_pagerange(pagerange)
+        pageurls = (page_url(url, pagekey, i) for i in _page_numbers(start, end, step))
+        pages = _map_pages(process_page, pageurls, workers, pagesize,
+                           lambda tables: max([len(rows) for tableid, rows in tables] or [0]),
+                           checkpoint)
+    for tables in pages:
+        for tableid, rows in tables:
+            metrics.add_rows(len(rows))
+            for row in rows:
+                yield tableid, row
+
+
+def get_table(url, nodeid=None, nodeclass=None, pagekey=False, pagerange=False, agent=None,
+              workers=1, filename=None, stream=False, headers=False, index=0, follow=None,
+              maxpages=None, checkpoint=None):
     """Extracts table with data from html
      :param url:
          HTML webpage url
@@ -169,56 +546,79 @@ def get_table(url, nodeid=None, nodeclass=None, pagekey=False, pagerange=False,
          Key of the page listing. GET or POST parameter
      :type pagekey: str|unicode
      :param pagerange:
-         Range of pages to process. String with format 'min,max,step', example: '1,72,1'
+         Range of pages to process. String with format 'min,max,step,pagesize', example: '1,72,1,-1'
      :type pagerange: str|unicode
+     :param workers:
+         Number of pages fetched in parallel
+     :type workers: int
+     :param filename:
+         Path to local html file, used if url is not set
+     :type filename: str|unicode
+     :param stream:
+         Parse page incrementally and keep in memory only current row
+     :type stream: bool
+     :param headers:
+         Return rows as dicts keyed by column headers taken from thead or rows of th cells
+     :type headers: bool
+     :param index:
+         Number of table with nodeid or nodeclass in document order, starting from 0
+     :type index: int
+     :param follow:
+         Follow next page links: XPath of next link or True to find link with rel=next. Next page is
+         fetched while current one is extracted, stops on page without next link or already visited
+     :type follow: str|unicode|bool
+     :param maxpages:
+         Max number of pages to follow
+     :type maxpages: int
+     :param checkpoint:
+         Checkpoint store of completed pages, pages done in previous run are not fetched again
+     :type checkpoint: :class:`lazyscraper.checkpoint.Checkpoint`
 
      :return: Returns array of extracted values
      :rtype: :class:`array`."""
+    return list(iter_get_table(url, nodeid, nodeclass, pagekey, pagerange, agent, workers, filename,
+                               stream, headers, index, follow, maxpages, checkpoint))
 
-    if pagekey is None:
-        root = get_cached_url(url, agent=agent)
-        tree = root.getroottree()
-        if nodeclass:
-            xfilter = "//table[@class='%s']" % (nodeclass)
-        elif nodeid:
-            xfilter = "//table[@id='%s']" % (nodeid)
-        else:
-            xfilter = '//table'
-        tags = tree.xpath(xfilter)
-        if len(tags) > 0:
-            findata = table_to_dict(tags[0], strip_lf=True)
-        else:
-            findata = []
-    else:
-        findata = []
-        start, end, step, pagesize = map(int, pagerange.split(','))
-#        for i in range(start, end, step):
-        current = start
-        while True:
-            anurl = url + '?%s=%d' % (pagekey,current)
-            logging.info('Crawling url %s' % (anurl))
-            root = get_cached_url(anurl)
-            logging.info('Got url %s' % (anurl))
-            tree = root.getroottree()
-            if nodeclass:
-                xfilter = "//table[@class='%s']" % (nodeclass)
-            elif nodeid:
-                xfilter = "//table[@id='%s']" % (nodeid)
-            else:
-                xfilter = '//table'
-            tags = tree.xpath(xfilter)
-            if len(tags) > 0:
-                items = table_to_dict(tags[0], strip_lf=True)
-                findata.extend(items)
-            else:
-                items = []
 
-            current += step
-            if pagesize != -1 and len(items) < pagesize:
-                logging.info('Breaking loop. %d vs %d' % (len(items), pagesize))
-                break
-            if end != -1 and current == end+1:
-                logging.info('Breaking loop. %d vs %d' % (len(items), pagesize))
-                break
-    return findata
+def get_tables(url, nodeid=None, nodeclass=None, pagekey=False, pagerange=False, agent=None,
+               workers=1, filename=None, headers=False, follow=None, maxpages=None,
+               checkpoint=None):
+    """Extracts all tables with nodeid or nodeclass from html, see :func:`iter_get_tables`
 
+    :return: Returns dict with table id as key and list of table rows as value
+    :rtype: :class:`dict`."""
+    tables = {}
+    for tableid, row in iter_get_tables(url, nodeid, nodeclass, pagekey, pagerange, agent, workers,
+                                        filename, headers, follow, maxpages, checkpoint):
+        tables.setdefault(tableid, []).append(row)
+    return tables
+
+
+def iter_batch(func, urls, workers=1, *args, **kwargs):
+    """Runs generator function like :func:`iter_get_table` for each url and yields its items with
+    source url added. Dict items get SOURCE_URL_FIELD key, list items (table rows) get url as first
+    value. Up to workers urls processed in parallel, items are yielded in urls order
+
+    :param func:
+        Generator function taking url as first argument
+    :type func: function
+    :param urls:
+        Iterable of urls
+    :type urls: iterable
+    :param workers:
+        Number of urls processed in parallel
+    :type workers: int
+
+    :return: Yields extracted values
+    :rtype: :class:`dict`|:class:`list`."""
+    def process_url(url):
+        logging.info('Processing url %s' % (url))
+        return url, list(func(url, *args, **kwargs))
+
+    for url, items in _map_pages(process_url, urls, workers):
+        for item in items:
+            if isinstance(item, dict):
+                item[SOURCE_URL_FIELD] = url
+                yield item
+            else:
+                yield [url] + list(item)
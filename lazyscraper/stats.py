@@ -0,0 +1,91 @@
+# -*- coding: utf8 -*-
+"""Timings of pipeline stages and counters of requests, bytes, cache hits and rows. Collected only
+when stats are set with :func:`set_stats`, otherwise instrumentation calls do nothing"""
+import time
+import threading
+from contextlib import contextmanager
+
+
+class Stats:
+    """Thread safe collector of per stage timings (calls and total seconds) and counters"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+
+    def add_time(self, stage, seconds):
+        with self.lock:
+            timing = self.timings.get(stage)
+            if timing is None:
+                timing = self.timings[stage] = [0, 0.0]
+            timing[0] += 1
+            timing[1] += seconds
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Returns dict with elapsed time, timings of stages and counters"""
+        with self.lock:
+            return {'elapsed' : time.perf_counter() - self.started,
+                    'timings' : {stage: {'calls' : calls, 'seconds' : seconds}
+                                 for stage, (calls, seconds) in self.timings.items()},
+                    'counters' : dict(self.counters)}
+
+    def report(self):
+        """Returns summary as text table"""
+        summary = self.summary()
+        lines = ['Elapsed %.3f s' % (summary['elapsed']),
+                 '%-20s %10s %12s %12s' % ('Stage', 'Calls', 'Total, s', 'Avg, ms')]
+        for stage, timing in sorted(summary['timings'].items(), key=lambda x: -x[1]['seconds']):
+            lines.append('%-20s %10d %12.3f %12.3f' % (stage, timing['calls'], timing['seconds'],
+                                                       timing['seconds'] * 1000 / timing['calls']))
+        lines.append('%-20s %10s' % ('Counter', 'Value'))
+        for name, value in sorted(summary['counters'].items()):
+            lines.append('%-20s %10d' % (name, value))
+        counters = summary['counters']
+        hits, misses = counters.get('cache.hits', 0), counters.get('cache.misses', 0)
+        if hits + misses:
+            lines.append('Cache hit ratio %.1f%%' % (hits * 100.0 / (hits + misses)))
+        return '\n'.join(lines)
+
+
+_stats = None
+
+
+def set_stats(stats):
+    """Sets stats collector used by instrumented functions. None disables stats"""
+    global _stats
+    _stats = stats
+
+
+def get_stats():
+    """Returns stats collector or None"""
+    return _stats
+
+
+def incr(name, value=1):
+    """Increments counter if stats are collected"""
+    if _stats is not None:
+        _stats.incr(name, value)
+
+
+def add_time(stage, seconds):
+    """Adds time spent in stage if stats are collected"""
+    if _stats is not None:
+        _stats.add_time(stage, seconds)
+
+
+@contextmanager
+def timer(stage):
+    """Measures time of the block as stage time if stats are collected"""
+    if _stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stage, time.perf_counter() - start)
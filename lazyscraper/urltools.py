@@ -1,73 +1,284 @@
 # -*- coding: utf8 -*-
-import json
-import hashlib
-import csv
 import logging
-import sys
-from urllib.request import urlopen
-from urllib.parse import urljoin, quote, urlsplit, urlunsplit
-import requests
+import threading
+import time
+from urllib.parse import urlsplit
 import lxml.html
 import lxml.etree
 from .consts import *
-try:
-    from bmemcached import Client
-    from zlib import compress, decompress
-except:
-    pass
-
-import ssl
-if hasattr(ssl, '_create_unverified_context'):
-    ssl._create_default_https_context = ssl._create_unverified_context
-
-def get_cached_post(url, postdata, host=None, port=11211, agent=DEFAULT_USER_AGENT):
-    """Returns url data from url with post request"""
-    servers = ["%s:%d" % (host, port)]
-    m = hashlib.sha256()
-    m.update(url.encode('utf8'))
-    m.update(str(postdata).encode('utf8'))
-    key = m.hexdigest()
-#    client = Client(servers)
-#    c_data = client.get(key)
-#    if c_data:
-#        data = decompress(c_data)
-#    else:
-    r = requests.post(url, postdata, headers={'User-Agent' : agent}, verify=False)
-    data = r.text
-#        client.set(key, compress(data))
-    hp = lxml.etree.HTMLParser(encoding='utf8')
-    root = lxml.html.fromstring(data, parser=hp)
+from .ratelimit import get_rate_limiter
+from . import stats, metrics
+from .cache import cache_key, make_entry, refresh_entry, is_fresh, conditional_headers, get_cache, \
+    MemcachedCache, content_digest, get_tree_cache
+
+_session = None
+_session_options = {}
+_session_lock = threading.Lock()
+_init_lock = threading.Lock()
+
+
+def _unverified_ssl():
+    """Disables certificate verification of default HTTPS context, as sessions do"""
+    import ssl
+    if hasattr(ssl, '_create_unverified_context'):
+        ssl._create_default_https_context = ssl._create_unverified_context
+
+
+def configure_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                      agent=DEFAULT_USER_AGENT, lazy=False):
+    """Creates shared HTTP session used by all fetch functions. pool_size is max number of kept
+    alive connections per host, retries and backoff control retries of failed connections and 5xx
+    responses. If lazy is True, only settings are saved and session is created (and requests
+    imported) on the first request"""
+    global _session, _session_options
+    if lazy:
+        with _session_lock:
+            _session_options = {'pool_size' : pool_size, 'retries' : retries, 'backoff' : backoff,
+                                'agent' : agent}
+            old, _session = _session, None
+        if old is not None:
+            old.close()
+        return None
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    _unverified_ssl()
+    session = requests.Session()
+    session.headers['User-Agent'] = agent
+    session.verify = False
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=None, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    with _session_lock:
+        old, _session = _session, session
+    if old is not None:
+        old.close()
+    return session
+
+
+def get_session():
+    """Returns shared HTTP session, creates it with settings saved by lazy :func:`configure_session`
+    or defaults"""
+    if _session is None:
+        with _init_lock:
+            if _session is None:
+                configure_session(**_session_options)
+    return _session
+
+
+def _request(url, postdata=None, headers=None, stream=False):
+    """Sends GET or POST (if postdata is set) request through shared session.
+    If rate limiter is set, waits for it and retries requests throttled by host"""
+    limiter = get_rate_limiter()
+    attempt = 0
+    while True:
+        if limiter is None:
+            return _send(url, postdata, headers, stream)
+        start = time.perf_counter()
+        with limiter.slot(url):
+            stats.add_time('fetch.ratelimit', time.perf_counter() - start)
+            r = _send(url, postdata, headers, stream)
+        if not limiter.feedback(url, r.status_code, r.headers.get('Retry-After')) or \
+                attempt >= limiter.retries:
+            return r
+        logging.info('Throttled by host with status %d, retrying url %s' % (r.status_code, url))
+        r.close()
+        attempt += 1
+
+
+def _send(url, postdata=None, headers=None, stream=False):
+    """Sends request. Time until response headers and time of body transfer are recorded as separate
+    stages. Shared session is taken before timing starts, as the first call creates it and imports
+    requests"""
+    session = get_session()
+    start = time.perf_counter()
+    host = urlsplit(url).netloc
+    metrics.request_started(host)
+    try:
+        if postdata is not None:
+            r = session.post(url, postdata, headers=headers, stream=stream)
+        else:
+            r = session.get(url, headers=headers, stream=stream)
+    except Exception as e:
+        metrics.request_finished(host, type(e).__name__, time.perf_counter() - start)
+        raise
+    metrics.request_finished(host, r.status_code, time.perf_counter() - start,
+                             None if stream else len(r.content))
+    if stats.get_stats() is not None:
+        elapsed = r.elapsed.total_seconds()
+        stats.add_time('fetch.wait', elapsed)
+        stats.incr('requests')
+        stats.incr('status.%d' % (r.status_code))
+        if not stream:
+            stats.add_time('fetch.transfer', max(time.perf_counter() - start - elapsed, 0.0))
+            stats.incr('bytes', len(r.content))
+    return r
+
+
+def _fetch(url, postdata=None, timeout=None, cache=None, agent=DEFAULT_USER_AGENT):
+    """Returns tuple of url content, cache key (None if caching disabled) and True if content was
+    served from cache. Expired cache entries revalidated with conditional request"""
+    if cache is None:
+        cache = get_cache()
+    method = 'POST' if postdata is not None else 'GET'
+    key = cache_key(url, method, postdata)
+    entry = None
+    headers = {'User-Agent' : agent} if agent else {}
+    if cache is not None:
+        with stats.timer('cache'):
+            entry = cache.get(key, stale=True)
+        if entry is not None:
+            if is_fresh(entry):
+                stats.incr('cache.hits')
+                metrics.cache_lookup('hit')
+                return entry['content'], key, True
+            headers.update(conditional_headers(entry))
+        stats.incr('cache.misses')
+        if entry is None:
+            metrics.cache_lookup('miss')
+    r = _request(url, postdata, headers or None)
+    if cache is None:
+        return r.content, None, False
+    ttl = timeout if timeout is not None else cache.timeout
+    if r.status_code == 304 and entry is not None:
+        logging.debug('Not modified %s' % (url))
+        stats.incr('cache.revalidated')
+        metrics.cache_lookup('revalidated')
+        cache.set(key, refresh_entry(entry, ttl))
+        return entry['content'], key, True
+    if entry is not None:
+        metrics.cache_lookup('miss')
+    if r.status_code == 200:
+        cache.set(key, make_entry(r.content, r.headers, ttl))
+    return r.content, key, False
+
+
+def fetch_url(url, postdata=None, timeout=None, cache=None, agent=DEFAULT_USER_AGENT):
+    """Returns raw content of url. Uses POST request if postdata is set.
+    Responses are taken from and stored to cache, shared cache used if cache is not set.
+    Cached responses live timeout seconds, cache default timeout used if not set"""
+    return _fetch(url, postdata, timeout, cache, agent)[0]
+
+
+def parse_html(content):
+    """Returns parsed html root node"""
+    start = time.perf_counter()
+    with stats.timer('parse'):
+        hp = lxml.etree.HTMLParser(encoding='utf8')
+        root = lxml.html.fromstring(content, parser=hp)
+    metrics.parse_time(time.perf_counter() - start)
     return root
 
-def get_cached_url(url, timeout=DEFAULT_CACHE_TIMEOUT, host=None, port=11211, agent=DEFAULT_USER_AGENT):
-    """Returns url data from url or from local memcached"""
-    c_data = None
-    client = None
-    if host is not None:
-        servers = ["%s:%d" % (host, port)]
-        m = hashlib.sha256()
-        m.update(url.encode('utf8'))
-        key = m.hexdigest()
-        try:
-            client = Client(servers)
-            c_data = client.get(key)
-        except NameError as ex:
-            pass
-    if c_data:
-        data = decompress(c_data)
+
+def _get_root(url, postdata, timeout, cache, agent):
+    """Returns parsed url. Pages with same content are not parsed again while they are in parsed
+    trees cache"""
+    content = _fetch(url, postdata, timeout, cache, agent)[0]
+    return parse_cached(content)
+
+
+def parse_cached(content):
+    """Returns parsed content, from parsed trees cache if same content was parsed before.
+    Returned trees are shared and should not be modified"""
+    trees = get_tree_cache()
+    if trees is None:
+        return parse_html(content)
+    digest = content_digest(content)
+    root = trees.get(digest)
+    if root is None:
+        root = parse_html(content)
+        trees.set(digest, root, len(content))
     else:
-        o = requests.get(url, headers={'User-Agent' : agent}, verify=False)
-        if client is not None:
-            client.set(key, compress(o.text))
-    hp = lxml.etree.HTMLParser(encoding='utf8')
-    root = lxml.html.fromstring(o.content, parser=hp)
+        stats.incr('tree_cache.hits')
     return root
 
 
+def get_cached_post(url, postdata, host=None, port=11211, agent=DEFAULT_USER_AGENT, timeout=None):
+    """Returns url data from url with post request or from cache"""
+    cache = _memcached(host, port) if host is not None else None
+    return _get_root(url, postdata, timeout, cache, agent)
+
+
+def get_cached_url(url, timeout=None, host=None, port=11211, agent=DEFAULT_USER_AGENT):
+    """Returns url data from url or from cache. If host is set, uses memcached on host:port"""
+    cache = _memcached(host, port) if host is not None else None
+    return _get_root(url, None, timeout, cache, agent)
+
+
+_memcached_clients = {}
+
+
+def _memcached(host, port):
+    """Returns memcached cache for host and port"""
+    if (host, port) not in _memcached_clients:
+        _memcached_clients[(host, port)] = MemcachedCache(host, port)
+    return _memcached_clients[(host, port)]
+
+
 def get_from_file(filename, encoding='utf-8'):
     """Returns parsed data from file"""
-    f = open(filename, 'r', encoding=encoding)
-    hp = lxml.etree.HTMLParser(encoding='utf8')
-    root = lxml.html.fromstring(f.read(), parser=hp)
-    f.close()
+    with stats.timer('read'):
+        f = open(filename, 'r', encoding=encoding)
+        content = f.read()
+        f.close()
+    stats.incr('bytes', len(content))
+    with stats.timer('parse'):
+        hp = lxml.etree.HTMLParser(encoding='utf8')
+        root = lxml.html.fromstring(content, parser=hp)
     return root
+
+
+def _feed_chunks(url=None, filename=None, postdata=None, agent=DEFAULT_USER_AGENT):
+    """Yields raw chunks of local file or HTTP response body"""
+    if filename is not None:
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+                stats.incr('bytes', len(chunk))
+                yield chunk
+        return
+    headers = {'User-Agent' : agent} if agent else None
+    r = _request(url, postdata, headers, stream=True)
+    with r:
+        host = urlsplit(url).netloc
+        for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+            stats.incr('bytes', len(chunk))
+            metrics.add_downloaded(host, len(chunk))
+            yield chunk
+
+
+def _clear_processed(el):
+    """Clears element and removes already parsed previous siblings of element and of its
+    ancestors"""
+    el.clear(keep_tail=True)
+    node = el
+    while node is not None:
+        parent = node.getparent()
+        if parent is None:
+            break
+        while node.getprevious() is not None:
+            del parent[0]
+        node = parent
+
+
+def iter_elements(url=None, filename=None, tag=None, match=None, postdata=None,
+                  agent=DEFAULT_USER_AGENT, encoding='utf-8'):
+    """Parses local file or HTTP response stream incrementally and yields elements with tag as they
+    are completed. If match is set, yields only elements for which match(element) is True. Processed
+    elements and already parsed elements before them are cleared, so memory use is bounded by size
+    of single element. Elements nested into element with same tag are kept until outer element is
+    processed"""
+    parser = lxml.etree.HTMLPullParser(events=('end',), tag=tag, encoding=encoding)
+    for chunk in _feed_chunks(url, filename, postdata, agent):
+        with stats.timer('parse'):
+            parser.feed(chunk)
+        for event, el in parser.read_events():
+            if match is None or match(el):
+                yield el
+            if next(el.iterancestors(el.tag), None) is None:
+                _clear_processed(el)
+    parser.close()
+    for event, el in parser.read_events():
+        if match is None or match(el):
+            yield el
@@ -0,0 +1,204 @@
+# -*- coding: utf8 -*-
+"""Streaming output writers. Each writer writes items as they are produced"""
+import csv
+import json
+import time
+from .consts import *
+from . import stats
+
+pyarrow = None
+
+
+def _load_pyarrow():
+    """Imports pyarrow on first use, it is slow to import and needed only for parquet and arrow
+    output"""
+    global pyarrow
+    if pyarrow is None:
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('pyarrow required for parquet and arrow output')
+    return pyarrow
+
+
+class CSVWriter:
+    """Writes dict items or lists (if dictrows is False) as CSV rows.
+    If fields not set for dict items, keys of the first item used as columns.
+    Header row is not written if header is False, as when appending to existing file"""
+    def __init__(self, io, fields=None, dictrows=True, header=True, **kwargs):
+        self.io = io
+        self.header = header
+        self.writer = None
+        if dictrows:
+            if fields:
+                self._dict_writer(fields)
+        else:
+            self.writer = csv.writer(io)
+            if fields and header:
+                self.writer.writerow(fields)
+
+    def _dict_writer(self, fields):
+        self.writer = csv.DictWriter(self.io, fieldnames=fields, extrasaction='ignore')
+        if self.header:
+            self.writer.writeheader()
+
+    def write(self, item):
+        if self.writer is None:
+            self._dict_writer(list(item.keys()))
+        self.writer.writerow(item)
+
+    def close(self):
+        pass
+
+
+class NDJSONWriter:
+    """Writes each item as JSON object on separate line"""
+    def __init__(self, io, sort_keys=False, **kwargs):
+        self.io = io
+        self.sort_keys = sort_keys
+
+    def write(self, item):
+        self.io.write(json.dumps(item, sort_keys=self.sort_keys) + '\n')
+
+    def close(self):
+        pass
+
+
+class JSONArrayWriter:
+    """Writes items as single JSON array, item by item. Pretty prints it if pretty is True"""
+    def __init__(self, io, pretty=False, sort_keys=False, **kwargs):
+        self.io = io
+        self.pretty = pretty
+        self.sort_keys = sort_keys
+        self.count = 0
+
+    def write(self, item):
+        if self.pretty:
+            text = json.dumps(item, sort_keys=self.sort_keys, indent=4)
+            text = '\n'.join('    ' + line for line in text.split('\n'))
+            self.io.write(('[\n' if self.count == 0 else ',\n') + text)
+        else:
+            self.io.write(('[' if self.count == 0 else ', ') +
+                          json.dumps(item, sort_keys=self.sort_keys))
+        self.count += 1
+
+    def close(self):
+        if self.count == 0:
+            self.io.write('[]')
+        else:
+            self.io.write('\n]' if self.pretty else ']')
+
+
+class ArrowWriter:
+    """Base class of columnar writers. Buffers up to batch_size rows and writes them as Arrow record
+    batch. All columns are strings, column names are fields, keys of the first dict item or, for
+    lists, col1, col2..."""
+    binary = True
+
+    def __init__(self, io, fields=None, dictrows=True, batch_size=DEFAULT_BATCH_SIZE, **kwargs):
+        _load_pyarrow()
+        self.io = io
+        self.names = list(fields) if fields else None
+        self.dictrows = dictrows
+        self.batch_size = batch_size
+        self.rows = []
+        self.schema = None
+        self.sink = None
+
+    def write(self, item):
+        self.rows.append(item)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def _value(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value)
+
+    def flush(self):
+        if self.names is None:
+            if self.dictrows:
+                self.names = list(self.rows[0].keys()) if self.rows else []
+            else:
+                width = len(self.rows[0]) if self.rows else 0
+                self.names = ['col%d' % (i + 1) for i in range(width)]
+        if self.schema is None:
+            self.schema = pyarrow.schema([(name, pyarrow.string()) for name in self.names])
+            self.sink = self.open_sink(self.schema)
+        if not self.rows:
+            return
+        if self.dictrows:
+            columns = [[self._value(row.get(name)) for row in self.rows] for name in self.names]
+        else:
+            columns = [[self._value(row[i]) if i < len(row) else None for row in self.rows]
+                       for i in range(len(self.names))]
+        arrays = [pyarrow.array(column, type=pyarrow.string()) for column in columns]
+        self.sink.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+
+class ArrowIPCWriter(ArrowWriter):
+    """Writes items as Arrow IPC file, batch by batch"""
+    def open_sink(self, schema):
+        return pyarrow.ipc.new_file(self.io, schema)
+
+
+class ParquetWriter(ArrowWriter):
+    """Writes items as Parquet file, each batch as row group"""
+    def open_sink(self, schema):
+        return pyarrow.parquet.ParquetWriter(self.io, schema)
+
+
+WRITERS = {
+    'text' : CSVWriter,
+    'csv' : CSVWriter,
+    'json' : JSONArrayWriter,
+    'ndjson' : NDJSONWriter,
+    'jsonl' : NDJSONWriter,
+    'arrow' : ArrowIPCWriter,
+    'parquet' : ParquetWriter,
+}
+
+
+def is_appendable(format):
+    """Returns True if output of format could be appended to existing file"""
+    return format in APPENDABLE_FORMATS
+
+
+def is_binary(format):
+    """Returns True if output format requires binary file"""
+    return getattr(WRITERS.get(format), 'binary', False)
+
+
+def get_writer(format, io, fields=None, dictrows=True, pretty=False, sort_keys=False, header=True):
+    """Returns writer for output format. If header is False CSV header row is not written"""
+    if format not in WRITERS:
+        raise ValueError('Unknown output format %s' % (format))
+    return WRITERS[format](io, fields=fields, dictrows=dictrows, pretty=pretty, sort_keys=sort_keys,
+                           header=header)
+
+
+def write_items(io, items, format, fields=None, dictrows=True, pretty=False, sort_keys=False,
+                header=True):
+    """Writes items to io as they are produced. Items are dicts with fields or lists if dictrows is
+    False"""
+    writer = get_writer(format, io, fields, dictrows, pretty, sort_keys, header)
+    if stats.get_stats() is None:
+        for item in items:
+            writer.write(item)
+    else:
+        count = 0
+        for item in items:
+            start = time.perf_counter()
+            writer.write(item)
+            stats.add_time('write', time.perf_counter() - start)
+            count += 1
+        stats.incr('rows', count)
+    with stats.timer('write'):
+        writer.close()
@@ -7,7 +7,8 @@ open_as_utf = lambda x: io.open(x, encoding='utf-8')
 (__version__, ) = re.findall("__version__.*\s*=\s*[']([^']+)[']",
                              open('lazyscraper/__init__.py').read())
 
-readme = re.sub(r':members:.+|..\sautomodule::.+|:class:|:func:', '', open_as_utf('README.rst').read())
+readme = re.sub(r':members:.+|..\sautomodule::.+|:class:|:func:', '',
+                open_as_utf('README.rst').read())
 readme = re.sub(r'`Settings`_', '`Settings`', readme)
 readme = re.sub(r'`Contributing`_', '`Contributing`', readme)
 #history = re.sub(r':mod:|:class:|:func:', '', open_as_utf('HISTORY.rst').read())
@@ -17,17 +18,27 @@ readme = re.sub(r'`Contributing`_', '`Contributing`', readme)
 setup(
     name='lazyscraper',
     version=__version__,
-    description="Lazy simple command line tool, a swiss knife for scraper writers. Automates scraping so much as possible",
+    description="Lazy simple command line tool, a swiss knife for scraper writers. "
+                "Automates scraping so much as possible",
     long_description=readme + '\n\n',
     author='Ivan Begtin',
     author_email='ivan@begtin.tech',
     url='https://github.com/ivbeg/lazyscraper',
-    packages=find_packages(exclude=('tests', 'tests.*')),
+    packages=find_packages(exclude=('tests', 'tests.*', 'benchmarks', 'benchmarks.*')),
     include_package_data=True,
     install_requires=[
         'lxml',
-        'click'
+        'click',
+        'requests'
     ],
+    python_requires='>=3.7',
+    extras_require={
+        'memcached': ['python-binary-memcached'],
+        # async fetch engine uses asyncio.to_thread, requires Python 3.9+
+        'async': ['httpx'],
+        'yaml': ['PyYAML'],
+        'arrow': ['pyarrow'],
+    },
     entry_points={
         'console_scripts': [
             'lscraper = lazyscraper.__main__:main',
@@ -42,10 +53,12 @@ setup(
         'License :: OSI Approved :: BSD License',
         'Natural Language :: English',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Programming Language :: Python :: Implementation :: CPython',
         'Programming Language :: Python :: Implementation :: PyPy'
     ]
@@ -0,0 +1,86 @@
+# -*- coding: utf8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from lazyscraper.checkpoint import Checkpoint
+from lazyscraper.scraper import _map_pages
+
+
+class Output:
+    def __init__(self, checkpoint):
+        self.checkpoint = checkpoint
+        self.flushed = []
+
+    def flush(self):
+        self.flushed.append(len(self.checkpoint))
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'pages.db')
+        self.fetched = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def fetch(self, page):
+        self.fetched.append(page)
+        return ['%d-%d' % (page, i) for i in range(2)]
+
+    def run_pages(self, checkpoint, pages=range(1, 5), stop=None):
+        items = []
+        for result in _map_pages(self.fetch, pages, checkpoint=checkpoint):
+            items.extend(result)
+            if stop is not None and len(items) >= stop:
+                break
+        return items
+
+    def test_page_saved_after_consumed(self):
+        checkpoint = Checkpoint(self.path)
+        pages = _map_pages(self.fetch, range(1, 4), checkpoint=checkpoint)
+        self.assertEqual(next(pages), ['1-0', '1-1'])
+        self.assertEqual(len(checkpoint), 0)
+        next(pages)
+        self.assertEqual(len(checkpoint), 1)
+        self.assertEqual(checkpoint.get('1'), ['1-0', '1-1'])
+        checkpoint.close()
+
+    def test_outputs_flushed_before_save(self):
+        checkpoint = Checkpoint(self.path)
+        output = Output(checkpoint)
+        checkpoint.add_output(output)
+        self.run_pages(checkpoint)
+        self.assertEqual(output.flushed, [0, 1, 2, 3])
+        checkpoint.close()
+
+    def test_resume_replay(self):
+        checkpoint = Checkpoint(self.path)
+        self.run_pages(checkpoint, stop=6)
+        checkpoint.close()
+        self.assertEqual(self.fetched, [1, 2, 3])
+        self.fetched = []
+        checkpoint = Checkpoint(self.path, resume=True)
+        self.assertEqual(len(checkpoint), 2)
+        items = self.run_pages(checkpoint)
+        self.assertEqual(self.fetched, [3, 4])
+        self.assertEqual(items, ['%d-%d' % (page, i) for page in range(1, 5) for i in range(2)])
+        checkpoint.close()
+
+    def test_resume_append(self):
+        checkpoint = Checkpoint(self.path)
+        self.run_pages(checkpoint, stop=4)
+        checkpoint.close()
+        checkpoint = Checkpoint(self.path, resume=True, replay=False)
+        self.assertEqual(self.run_pages(checkpoint), ['2-0', '2-1', '3-0', '3-1', '4-0', '4-1'])
+        checkpoint.close()
+
+    def test_without_resume_cleared(self):
+        checkpoint = Checkpoint(self.path)
+        self.run_pages(checkpoint)
+        checkpoint.close()
+        checkpoint = Checkpoint(self.path)
+        self.assertEqual(len(checkpoint), 0)
+        checkpoint.close()
@@ -0,0 +1,94 @@
+# -*- coding: utf8 -*-
+import os
+import unittest
+
+import lxml.html
+
+from lazyscraper.urltools import get_from_file
+from lazyscraper.htmltools import row_to_list, table_to_dict, table_to_records, rows_to_records, \
+    header_names, iter_table_rows, stream_selector
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+SPANS = os.path.join(FIXTURES, 'spans.html')
+
+
+def table(root, nodeid):
+    return root.xpath('//table[@id=$nodeid]', nodeid=nodeid)[0]
+
+
+class TestTableGrid(unittest.TestCase):
+    def setUp(self):
+        self.root = get_from_file(SPANS)
+
+    def test_span_expansion(self):
+        self.assertEqual(table_to_dict(table(self.root, 'spans')),
+                         [['x', '1', '2', 'p'], ['x', '3', '4', 'q'],
+                          ['all', 'all', 'all', 'r'], ['y', '5', '6', 'r']])
+
+    def test_list_mode_skips_thead_and_tfoot(self):
+        rows = table_to_dict(table(self.root, 'spans'))
+        self.assertNotIn('Name', [row[0] for row in rows])
+        self.assertNotIn('total', [row[0] for row in rows])
+
+    def test_rows_without_tbody(self):
+        rows = table_to_dict(table(self.root, 'plain'))
+        self.assertEqual(rows[0], ['a', 'b'])
+        self.assertEqual(rows[1], ['c', [[['n1']]]])
+
+    def test_row_without_pending(self):
+        root = lxml.html.fromstring('<table><tr><td colspan="2">a</td><td rowspan="3">b</td></tr>'
+                                    '</table>')
+        self.assertEqual(row_to_list(root.xpath('//tr')[0]), ['a', 'a', 'b'])
+
+    def test_rowspan_past_row_end(self):
+        root = lxml.html.fromstring('<table><tr><td>a</td><td>b</td><td rowspan="2">c</td></tr>'
+                                    '<tr><td>d</td></tr></table>')
+        self.assertEqual(table_to_dict(root), [['a', 'b', 'c'], ['d', '', 'c']])
+
+    def test_invalid_spans(self):
+        root = lxml.html.fromstring('<table><tr><td colspan="x">a</td><td colspan="0">b</td>'
+                                    '<td rowspan="-1">c</td></tr></table>')
+        self.assertEqual(table_to_dict(root), [['a', 'b', 'c']])
+
+
+class TestHeaderRecords(unittest.TestCase):
+    def setUp(self):
+        self.root = get_from_file(SPANS)
+
+    def test_multirow_headers(self):
+        records = table_to_records(table(self.root, 'spans'))
+        self.assertEqual(records[0], {'Name': 'x', 'Score A': '1', 'Score B': '2', 'Name_4': 'p'})
+        self.assertEqual(list(records[0].keys()), ['Name', 'Score A', 'Score B', 'Name_4'])
+
+    def test_tfoot_is_record(self):
+        records = table_to_records(table(self.root, 'spans'))
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[-1]['Name'], 'total')
+
+    def test_th_row_without_thead(self):
+        root = lxml.html.fromstring('<table><tr><th>a</th><th>b</th></tr>'
+                                    '<tr><td>1</td><td>2</td><td>3</td></tr></table>')
+        self.assertEqual(list(rows_to_records(iter_table_rows(root))),
+                         [{'a': '1', 'b': '2', 'col3': '3'}])
+
+    def test_header_names(self):
+        self.assertEqual(header_names([['a', 'a'], ['b', 'c']]), ['a b', 'a c'])
+        self.assertEqual(header_names([['a', '']], 3), ['a', 'col2', 'col3'])
+        self.assertEqual(header_names([['a', 'a']]), ['a', 'a_2'])
+
+
+class TestStreamSelector(unittest.TestCase):
+    def test_simple(self):
+        self.assertEqual(stream_selector('//a'), ('a', None))
+        tag, match = stream_selector("//a[@class='item']")
+        self.assertEqual(tag, 'a')
+
+    def test_position_predicates_rejected(self):
+        for xpath in ['//td[2]', '//td[last()]', '//td[position() > 1]',
+                      '//td[preceding-sibling::td]', '//td[following::tr]', '//ul/li',
+                      '//a[@id][1]']:
+            with self.assertRaises(ValueError):
+                stream_selector(xpath)
+
+    def test_keywords_in_strings_allowed(self):
+        stream_selector("//a[@class='following']")
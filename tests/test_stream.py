@@ -0,0 +1,38 @@
+# -*- coding: utf8 -*-
+import os
+import unittest
+
+from lazyscraper.scraper import get_table, extract_data_xpath
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+SPANS = os.path.join(FIXTURES, 'spans.html')
+
+
+class TestStreamParity(unittest.TestCase):
+    """Incremental parsing, which clears processed elements, returns same data as full parse"""
+    def test_table_rows(self):
+        for nodeid in ['spans', 'plain']:
+            self.assertEqual(get_table(None, nodeid=nodeid, filename=SPANS, stream=True),
+                             get_table(None, nodeid=nodeid, filename=SPANS))
+
+    def test_table_records(self):
+        self.assertEqual(get_table(None, nodeid='spans', filename=SPANS, stream=True, headers=True),
+                         get_table(None, nodeid='spans', filename=SPANS, headers=True))
+
+    def test_first_table(self):
+        self.assertEqual(get_table(None, filename=SPANS, stream=True),
+                         get_table(None, filename=SPANS))
+
+    def test_xpath(self):
+        for xpath in ['//a', "//a[@class='item']", '//th']:
+            self.assertEqual(extract_data_xpath(None, filename=SPANS, xpath=xpath, stream=True),
+                             extract_data_xpath(None, filename=SPANS, xpath=xpath))
+
+    def test_nested_xpath(self):
+        # nested elements are yielded when their end tag is parsed, before the outer element
+        self.assertCountEqual(extract_data_xpath(None, filename=SPANS, xpath='//td', stream=True),
+                              extract_data_xpath(None, filename=SPANS, xpath='//td'))
+
+    def test_stream_rejects_table_index(self):
+        with self.assertRaises(ValueError):
+            get_table(None, nodeid='spans', filename=SPANS, stream=True, index=1)